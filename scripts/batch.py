@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from types import SimpleNamespace
+import metrics
+from llm_pool import client, call_with_retry
+from state import load_processed
+from pdf_text import file_digest
+import generate_infographic
+from generate_infographic import MODEL, apply_result, draft_messages, inspect_entry, needs_check, parse_draft
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+BATCH_DIR = os.path.join(REPO_DIR, 'data/batches')
+JOBS_FILE = os.path.join(BATCH_DIR, 'jobs.json')
+
+os.makedirs(BATCH_DIR, exist_ok=True)
+
+ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+# Batch API は同期APIの半額
+BATCH_DISCOUNT = 0.5
+# 1ジョブあたりの最大リクエスト数（Batch API の上限より十分小さくする）
+MAX_REQUESTS_PER_JOB = 5000
+POLL_INTERVAL = 30
+
+# これらの状態では出力ファイルがあれば途中までの結果を取り込む
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+def load_jobs():
+    if not os.path.exists(JOBS_FILE):
+        return []
+    with open(JOBS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_jobs(jobs):
+    tmp_path = JOBS_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(jobs, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, JOBS_FILE)
+
+def custom_id(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+
+def queued_urls(jobs):
+    # 未完了のジョブに入っている資料は二重に投入しない
+    return {request['url'] for job in jobs if not job.get('done')
+            for request in job['requests'].values()}
+
+def collect_pending(processed, jobs, force=False):
+    skip = queued_urls(jobs)
+    pending = []
+    seen_paths = set()
+    for url, data in processed.items():
+        if url in skip or data['local_path'] in seen_paths or not (force or needs_check(data)):
+            continue
+        seen_paths.add(data['local_path'])
+        try:
+            result = inspect_entry(data, force)
+            if result['status'] == 'pending':
+                pending.append((url, data, result))
+            else:
+                apply_result(url, data, result)
+        except Exception as e:
+            print(f"Error inspecting {data['text']}: {e}")
+    return pending
+
+def write_job_file(path, pending):
+    requests = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        for url, data, result in pending:
+            request_id = custom_id(url)
+            body = {'model': MODEL, 'messages': draft_messages(data['text'], result['pdf_text']),
+                    'response_format': {'type': 'json_object'}}
+            f.write(json.dumps({'custom_id': request_id, 'method': 'POST', 'url': ENDPOINT, 'body': body},
+                               ensure_ascii=False) + "\n")
+            requests[request_id] = {'url': url, 'fingerprint': result['fingerprint']}
+    return requests
+
+def submit(processed=None, force=False):
+    # 未生成の資料のプロンプトをJSONLにまとめ、Batch API に投入してジョブIDを記録する
+    if processed is None:
+        processed = load_processed()
+    jobs = load_jobs()
+    pending = collect_pending(processed, jobs, force)
+    if not pending:
+        print("No pending drafts to submit")
+        return []
+
+    submitted = []
+    for start in range(0, len(pending), MAX_REQUESTS_PER_JOB):
+        chunk = pending[start:start + MAX_REQUESTS_PER_JOB]
+        local_id = time.strftime('%Y%m%d-%H%M%S') + f"-{start // MAX_REQUESTS_PER_JOB}"
+        path = os.path.join(BATCH_DIR, f"{local_id}.jsonl")
+        requests = write_job_file(path, chunk)
+
+        def upload():
+            # 再試行のたびにファイルを先頭から読み直す
+            with open(path, 'rb') as f:
+                return client.files.create(file=f, purpose='batch')
+
+        input_file = call_with_retry(upload)
+        batch = call_with_retry(lambda: client.batches.create(
+            input_file_id=input_file.id, endpoint=ENDPOINT, completion_window=COMPLETION_WINDOW,
+            metadata={'job': local_id}))
+        job = {'id': local_id, 'batch_id': batch.id, 'input_file_id': input_file.id, 'status': batch.status,
+               'created': time.time(), 'requests': requests, 'ingested': [], 'failed': {}}
+        # 投入のたびに記録し、途中で落ちても次回の実行で同じ資料を二重投入しない
+        jobs.append(job)
+        save_jobs(jobs)
+        submitted.append(job)
+        print(f"Submitted batch {batch.id} with {len(requests)} drafts ({path})")
+    return submitted
+
+def read_output(file_id):
+    content = call_with_retry(lambda: client.files.content(file_id))
+    for line in content.text.splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+def ingest_line(processed, job, line):
+    request = job['requests'].get(line.get('custom_id'))
+    if request is None:
+        return None
+    url = request['url']
+    data = processed.get(url)
+    if data is None:
+        return 'unknown entry'
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        return str(line.get('error') or response.get('status_code'))
+    # 投入後にPDFが更新されていたら古い原稿は使わない（次回の投入で作り直す）
+    if not os.path.exists(data['local_path']) or file_digest(data['local_path']) != request['fingerprint']['pdf']:
+        return 'pdf changed since submission'
+
+    body = response['body']
+    metrics.record_llm(body.get('model', MODEL), SimpleNamespace(**(body.get('usage') or {})), None,
+                       data['text'], discount=BATCH_DISCOUNT)
+    draft = parse_draft(body['choices'][0]['message']['content'])
+    apply_result(url, data, {'status': 'drafted', 'fingerprint': request['fingerprint'], 'draft': draft})
+    return None
+
+def ingest(processed, job, file_id):
+    # 1件ずつ保存するので、途中で失敗しても取り込み済みの原稿は残る
+    ingested = set(job['ingested'])
+    for line in read_output(file_id):
+        request_id = line.get('custom_id')
+        if request_id in ingested:
+            continue
+        try:
+            error = ingest_line(processed, job, line)
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+        if error:
+            job['failed'][request_id] = error
+        else:
+            job['ingested'].append(request_id)
+            ingested.add(request_id)
+            job['failed'].pop(request_id, None)
+
+def poll(processed=None, wait=False):
+    # 未完了のジョブの状態を確認し、終わったものの結果を data/drafts に取り込む
+    if processed is None:
+        processed = load_processed()
+    jobs = load_jobs()
+    while True:
+        for job in jobs:
+            if job.get('done'):
+                continue
+            batch = call_with_retry(lambda: client.batches.retrieve(job['batch_id']))
+            job['status'] = batch.status
+            if batch.status not in FINAL_STATUSES:
+                continue
+            if batch.output_file_id:
+                ingest(processed, job, batch.output_file_id)
+            if batch.error_file_id:
+                for line in read_output(batch.error_file_id):
+                    job['failed'][line.get('custom_id')] = str(line.get('error') or line.get('response'))
+            job['done'] = True
+            print(f"Batch {job['batch_id']} {batch.status}: {len(job['ingested'])} ingested, "
+                  f"{len(job['failed'])} failed (failed drafts are resubmitted on the next run)")
+            save_jobs(jobs)
+        save_jobs(jobs)
+        open_jobs = [job for job in jobs if not job.get('done')]
+        if not wait or not open_jobs:
+            return [job for job in jobs if job.get('done')], open_jobs
+        print(f"Waiting for {len(open_jobs)} batches...")
+        time.sleep(POLL_INTERVAL)
+
+def run(processed=None, force=False, wait=False):
+    # cron から毎回呼ぶ想定: 終わったジョブを取り込んでから、新たに未生成の資料を投入する
+    if processed is None:
+        processed = load_processed()
+    poll(processed)
+    submitted = submit(processed, force)
+    if wait and submitted:
+        poll(processed, wait=True)
+    # 同じPDFを指す別URLのエントリは、取り込んだ結果を引き継ぐ
+    generate_infographic.copy_from_twins(processed, [url for url, data in processed.items()
+                                                     if not data.get('processed')])
+    return submitted
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batch API で原稿をまとめて生成する')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'submit', 'poll'],
+                        help='run: 取り込みと投入の両方（既定）/ submit: 投入のみ / poll: 取り込みのみ')
+    parser.add_argument('--force', action='store_true', help='変更の有無にかかわらず全件を投入する')
+    parser.add_argument('--wait', action='store_true', help='投入したジョブが終わるまで待って取り込む')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with metrics.stage(f"batch_{args.command}"):
+        if args.command == 'submit':
+            submit(force=args.force)
+        elif args.command == 'poll':
+            poll(wait=args.wait)
+        else:
+            run(force=args.force, wait=args.wait)
+    metrics.export('batch')
@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import threading
+import itertools
+import subprocess
+from functools import partial
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+SOURCE_DOWNLOAD_DIR = os.path.join(REPO_DIR, 'data/downloads')
+SOURCE_DRAFT_DIR = os.path.join(REPO_DIR, 'data/drafts')
+BASELINE_FILE = os.path.join(REPO_DIR, 'data/benchmark_baseline.json')
+
+BENCH_SIZES = [10, 100, 1000]
+# スタブのOpenAIが1リクエストに返すまでの待ち時間（秒）
+DEFAULT_LATENCY = 0.5
+# 一覧ページ1枚あたりのPDFリンク数
+LINKS_PER_PAGE = 50
+# ベースラインよりこの倍率以上遅くなったステージを退行として報告する
+REGRESSION_THRESHOLD = 1.25
+STAGES = ['check_pdfs', 'generate_infographic', 'batch', 'generate_index', 'build_css']
+# --batch 指定時にジョブの状態を確認する間隔（秒）
+BATCH_POLL_INTERVAL = 0.2
+
+def build_site(site_dir, size):
+    # 手元のPDFを末尾だけ変えて複製し、別々の資料（別々のハッシュ）として配信する
+    sources = sorted(os.path.join(SOURCE_DOWNLOAD_DIR, name) for name in os.listdir(SOURCE_DOWNLOAD_DIR)
+                     if name.endswith('.pdf'))
+    if not sources:
+        raise RuntimeError(f"No PDFs to serve in {SOURCE_DOWNLOAD_DIR}")
+    contents = []
+    for path in sources:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+
+    os.makedirs(os.path.join(site_dir, 'pdf'))
+    os.makedirs(os.path.join(site_dir, 'list'))
+    for i in range(size):
+        with open(os.path.join(site_dir, 'pdf', f"{i}.pdf"), 'wb') as f:
+            f.write(contents[i % len(contents)] + f"\n%bench-{i}\n".encode('ascii'))
+
+    pages = []
+    for page, start in enumerate(range(0, size, LINKS_PER_PAGE)):
+        anchors = "\n".join(f'<li><a href="/pdf/{i}.pdf">ベンチマーク資料 {i}</a></li>'
+                            for i in range(start, min(size, start + LINKS_PER_PAGE)))
+        with open(os.path.join(site_dir, 'list', f"{page}.html"), 'w', encoding='utf-8') as f:
+            f.write(f'<html><head><meta charset="utf-8"></head><body><ul>\n{anchors}\n</ul></body></html>')
+        pages.append(f"/list/{page}.html")
+    return pages
+
+def load_drafts():
+    drafts = []
+    for name in sorted(os.listdir(SOURCE_DRAFT_DIR)):
+        if name.endswith('.json'):
+            with open(os.path.join(SOURCE_DRAFT_DIR, name), 'r', encoding='utf-8') as f:
+                drafts.append(f.read())
+    if not drafts:
+        raise RuntimeError(f"No drafts to replay in {SOURCE_DRAFT_DIR}")
+    return drafts
+
+def chat_response(stub, request):
+    # リクエストごとに保存済みの原稿を順番に返す
+    with stub['lock']:
+        content = next(stub['drafts'])
+        stub['requests'] += 1
+        number = stub['requests']
+    prompt_tokens = sum(len(message.get('content') or '') for message in request.get('messages', []))
+    return {
+        'id': f"chatcmpl-bench-{number}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model'),
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content),
+                  'total_tokens': prompt_tokens + len(content)},
+    }
+
+class BenchHandler(SimpleHTTPRequestHandler):
+    # GET は一覧ページとPDFを静的に返し、/v1/ 以下は OpenAI の chat completions と Files/Batches API を模倣する
+    def do_GET(self):
+        if not self.path.startswith('/v1/'):
+            return super().do_GET()
+        stub = self.server.stub
+        parts = self.path.strip('/').split('/')
+        if parts[1:2] == ['batches'] and len(parts) == 3 and parts[2] in stub['batches']:
+            batch = dict(stub['batches'][parts[2]])
+            # 応答待ち時間が過ぎるまでは処理中として返す
+            if time.time() < batch.pop('ready_at'):
+                batch.update(status='in_progress', output_file_id=None)
+            return self.send_json(batch)
+        if parts[1:2] == ['files'] and len(parts) == 4 and parts[3] == 'content' and parts[2] in stub['files']:
+            return self.send_bytes(stub['files'][parts[2]], 'application/jsonl')
+        self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length)
+        stub = self.server.stub
+        if self.path.endswith('/chat/completions'):
+            time.sleep(stub['latency'])
+            # failures に積まれたステータスを先頭から1件ずつ返す（再試行のテスト用）
+            with stub['lock']:
+                stub['attempts'] += 1
+                failure = stub['failures'].pop(0) if stub['failures'] else None
+            if failure:
+                status, retry_after = failure if isinstance(failure, tuple) else (failure, None)
+                headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+                return self.send_json({'error': {'message': f"stub error {status}", 'type': 'stub_error',
+                                                 'param': None, 'code': None}}, status, headers)
+            return self.send_json(chat_response(stub, json.loads(raw or b'{}')))
+        if self.path.endswith('/files'):
+            return self.send_json(self.create_file(raw))
+        if self.path.endswith('/batches'):
+            return self.send_json(self.create_batch(json.loads(raw or b'{}')))
+        self.send_error(404)
+
+    def create_file(self, raw):
+        # multipart/form-data の file パートを取り出して保存する
+        message = BytesParser(policy=email_policy).parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode('latin-1') + b'\r\n\r\n' + raw)
+        content = b''
+        for part in message.iter_parts():
+            if part.get_param('name', header='content-disposition') == 'file':
+                content = part.get_payload(decode=True)
+        stub = self.server.stub
+        with stub['lock']:
+            file_id = f"file-bench-{len(stub['files']) + 1}"
+            stub['files'][file_id] = content
+        return {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': 'batch.jsonl', 'purpose': 'batch', 'status': 'processed'}
+
+    def create_batch(self, request):
+        # 投入された各リクエストに即座に応答を作り、latency 秒後に完了として見せる
+        # batch_failures に積まれたステータスは先頭の行から順に失敗として返し、batch_limit を超えた行は
+        # 出力せずに期限切れ（expired）として見せる（途中までの結果の取り込みのテスト用）
+        stub = self.server.stub
+        lines = []
+        failed = 0
+        status = 'completed'
+        for line in stub['files'][request['input_file_id']].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            if stub['batch_limit'] is not None and len(lines) >= stub['batch_limit']:
+                status = 'expired'
+                break
+            item = json.loads(line)
+            with stub['lock']:
+                failure = stub['batch_failures'].pop(0) if stub['batch_failures'] else None
+            if failure:
+                failed += 1
+                body = {'error': {'message': f"stub error {failure}", 'type': 'stub_error'}}
+            else:
+                body = chat_response(stub, item['body'])
+            lines.append(json.dumps({'id': f"batch_req_{item['custom_id']}", 'custom_id': item['custom_id'],
+                                     'response': {'status_code': failure or 200, 'request_id': item['custom_id'],
+                                                  'body': body},
+                                     'error': None}, ensure_ascii=False))
+        with stub['lock']:
+            output_id = f"file-bench-{len(stub['files']) + 1}"
+            stub['files'][output_id] = ("\n".join(lines) + "\n").encode('utf-8')
+            batch_id = f"batch-bench-{len(stub['batches']) + 1}"
+            now = int(time.time())
+            stub['batches'][batch_id] = {
+                'id': batch_id, 'object': 'batch', 'endpoint': request.get('endpoint'),
+                'input_file_id': request['input_file_id'], 'completion_window': request.get('completion_window'),
+                'status': status, 'output_file_id': output_id, 'error_file_id': None,
+                'created_at': now, 'ready_at': time.time() + stub['latency'],
+                'request_counts': {'total': len(lines), 'completed': len(lines) - failed, 'failed': failed},
+            }
+        return dict(stub['batches'][batch_id], status='validating', output_file_id=None, ready_at=None)
+
+    def send_json(self, payload, status=200, headers=None):
+        payload.pop('ready_at', None)
+        self.send_bytes(json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json', status, headers)
+
+    def send_bytes(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(site_dir, latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(BenchHandler, directory=site_dir))
+    server.daemon_threads = True
+    server.stub = {'latency': latency, 'drafts': itertools.cycle(load_drafts()),
+                   'lock': threading.Lock(), 'requests': 0, 'attempts': 0, 'failures': [],
+                   'files': {}, 'batches': {}, 'batch_failures': [], 'batch_limit': None}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_size(size, latency, host_interval, keep=False, batch=False):
+    workspace = tempfile.mkdtemp(prefix=f'bench-{size}-')
+    site_dir = os.path.join(workspace, 'site')
+    os.makedirs(os.path.join(workspace, 'data'))
+    os.makedirs(os.path.join(workspace, 'docs'))
+    server = None
+    try:
+        pages = build_site(site_dir, size)
+        server = start_server(site_dir, latency)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        with open(os.path.join(workspace, 'data', 'urls.txt'), 'w') as f:
+            f.write("\n".join(base_url + page for page in pages) + "\n")
+
+        # 各ステージは作業ディレクトリを向けた子プロセスで実行し、RSSとサブプロセス数を独立に測る
+        env = dict(os.environ, MANUS_REPO_DIR=workspace, OPENAI_BASE_URL=f"{base_url}/v1",
+                   OPENAI_API_KEY='benchmark')
+        result_path = os.path.join(workspace, 'result.json')
+        log_path = os.path.join(workspace, 'run.log')
+        print(f"Running {size} documents (log: {log_path})...", flush=True)
+        with open(log_path, 'w') as log:
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'child', result_path,
+                            '--size', str(size), '--host-interval', str(host_interval)]
+                           + (['--batch'] if batch else []),
+                           env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        result['llm_requests'] = server.stub['requests']
+        return result
+    finally:
+        if server:
+            server.shutdown()
+        if not keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+def peak_rss_mb(who):
+    # Linux の ru_maxrss はKB単位
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+def run_child(result_path, size, host_interval, batch=False):
+    # 計測対象のモジュールは MANUS_REPO_DIR が設定された後に読み込む
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import check_pdfs
+    import generate_infographic
+    import generate_index
+    import build_css
+    from state import load_processed
+
+    spawned = [0]
+    popen = subprocess.Popen
+
+    class CountingPopen(popen):
+        def __init__(self, *args, **kwargs):
+            spawned[0] += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    check_pdfs.HOST_MIN_INTERVAL = host_interval
+
+    stages = {}
+
+    def measure(name, fn, *args, **kwargs):
+        before = spawned[0]
+        started = time.monotonic()
+        value = fn(*args, **kwargs)
+        elapsed = time.monotonic() - started
+        stages[name] = {
+            'seconds': round(elapsed, 3),
+            'docs_per_s': round(size / elapsed, 2) if elapsed else None,
+            'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+            'peak_child_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'subprocesses': spawned[0] - before,
+        }
+        return value
+
+    processed = load_processed()
+    pool = check_pdfs.create_pool()
+    try:
+        new_pdfs = measure('check_pdfs', check_pdfs.main, processed=processed, pool=pool)
+    finally:
+        pool.close()
+    changed = set(new_pdfs)
+    if batch:
+        # 原稿は Batch API（スタブ）経由で作り、完了を待って取り込む（取り込み時にHTMLも描画される）
+        import batch as batch_mode
+        batch_mode.POLL_INTERVAL = BATCH_POLL_INTERVAL
+        submitted = measure('batch', batch_mode.run, processed=processed, wait=True)
+        generated = [url for job in submitted for url in job['requests']]
+    else:
+        generated = measure('generate_infographic', generate_infographic.main, processed=processed, changed=changed)
+    measure('generate_index', generate_index.main, processed=processed)
+    measure('build_css', build_css.main)
+
+    result = {'size': size, 'downloaded': len(new_pdfs), 'generated': len(generated), 'stages': stages,
+              'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 3)}
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for size, result in results.items():
+        previous = baseline.get('results', {}).get(size)
+        if not previous:
+            continue
+        for stage, metrics in result['stages'].items():
+            before = previous['stages'].get(stage)
+            if not before or not before['seconds']:
+                continue
+            ratio = metrics['seconds'] / before['seconds']
+            metrics['vs_baseline'] = round(ratio, 2)
+            if ratio >= threshold:
+                regressions.append(f"{stage} at {size} docs: {before['seconds']}s -> {metrics['seconds']}s (x{ratio:.2f})")
+    return regressions
+
+def print_report(results):
+    print(f"{'docs':>6} {'stage':<22} {'seconds':>9} {'docs/s':>9} {'rss MB':>8} {'child MB':>9} {'procs':>6} {'vs base':>8}")
+    for size, result in results.items():
+        for stage in STAGES:
+            m = result['stages'].get(stage)
+            if m:
+                print(f"{size:>6} {stage:<22} {m['seconds']:>9.2f} {m['docs_per_s'] or 0:>9.1f} {m['peak_rss_mb']:>8.1f} "
+                      f"{m['peak_child_rss_mb']:>9.1f} {m['subprocesses']:>6} {m.get('vs_baseline', '-'):>8}")
+        print(f"{size:>6} {'total':<22} {result['total_seconds']:>9.2f}  "
+              f"(downloaded {result['downloaded']}, generated {result['generated']}, LLM requests {result['llm_requests']})")
+
+def main(sizes=None, latency=DEFAULT_LATENCY, host_interval=0.0, save_baseline=False,
+         baseline_path=BASELINE_FILE, keep=False, batch=False):
+    results = {}
+    for size in sizes or BENCH_SIZES:
+        results[str(size)] = run_size(size, latency, host_interval, keep, batch)
+
+    # 条件が異なるベースラインとは比較しない
+    settings = {'latency': latency, 'host_interval': host_interval}
+    if batch:
+        settings['batch'] = True
+    regressions = []
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('settings') == settings:
+            regressions = compare(results, baseline)
+        else:
+            print(f"Baseline was recorded with {baseline.get('settings')}, not comparing")
+
+    print_report(results)
+    if save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return not regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='ローカルのHTTPサーバーとスタブのOpenAIでパイプライン全体を計測する')
+    subparsers = parser.add_subparsers(dest='command')
+    child = subparsers.add_parser('child', help='（内部用）作業ディレクトリで各ステージを実行して計測する')
+    child.add_argument('result_path')
+    child.add_argument('--size', type=int, required=True)
+    child.add_argument('--host-interval', type=float, default=0.0)
+    child.add_argument('--batch', action='store_true')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCH_SIZES, help='計測する資料数')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='スタブのOpenAIの応答待ち時間（秒）')
+    parser.add_argument('--host-interval', type=float, default=0.0,
+                        help='同一ホストへのリクエスト間隔（秒）。既定では礼儀待ちを入れない')
+    parser.add_argument('--save-baseline', action='store_true', help='今回の結果をベースラインとして保存する')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='比較・保存するベースラインのパス')
+    parser.add_argument('--batch', action='store_true', help='原稿を Batch API モード（batch.py）で生成して計測する')
+    parser.add_argument('--keep', action='store_true', help='作業ディレクトリを削除せずに残す')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'child':
+        run_child(args.result_path, args.size, args.host_interval, args.batch)
+    else:
+        ok = main(sizes=args.sizes, latency=args.latency, host_interval=args.host_interval,
+                  save_baseline=args.save_baseline, baseline_path=args.baseline, keep=args.keep,
+                  batch=args.batch)
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,167 @@
+import os
+import re
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, unquote_to_bytes
+from pdf_text import file_digest
+from state import get_store
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+DOWNLOAD_DIR = os.path.join(REPO_DIR, 'data/downloads')
+# ダウンロード途中のファイルの置き場所（検証後にハッシュ名で保存し直す）
+INCOMING_DIR = os.path.join(DOWNLOAD_DIR, '.incoming')
+
+os.makedirs(INCOMING_DIR, exist_ok=True)
+
+# URL正規化の設定。キャッシュバスター（?28 など）やトラッキング用のクエリを取り除く
+URL_NORMALIZATION = {
+    # 数字だけのクエリをキャッシュバスターとみなすホスト（?1 と ?2 で別の資料を返すサイトもあるので全ホストには広げない）
+    'numeric_query_hosts': ['www.jizokukanb.com'],
+    'drop_params': ['v', 'ver', 'version', 't', 'ts', '_', 'utm_source', 'utm_medium', 'utm_campaign'],
+    # クエリをすべて無視するホスト
+    'drop_query_hosts': [],
+}
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+PERCENT_ESCAPES = re.compile(r'(?:%[0-9A-Fa-f]{2})+')
+# RFC 3986 の非予約文字。これ以外（%2F や %3F など）はデコードすると意味が変わるのでエスケープのまま残す
+UNRESERVED = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+def _utf8_length(lead):
+    if lead >= 0xF0:
+        return 4
+    if lead >= 0xE0:
+        return 3
+    if lead >= 0xC0:
+        return 2
+    return 1
+
+def _decode_escapes(match):
+    raw = unquote_to_bytes(match.group(0))
+    out = []
+    i = 0
+    while i < len(raw):
+        byte = raw[i]
+        if byte < 0x80:
+            out.append(chr(byte) if byte in UNRESERVED else f"%{byte:02X}")
+            i += 1
+            continue
+        # 日本語のファイル名などの UTF-8 は文字に戻す。壊れたバイト列はエスケープのまま残す
+        size = _utf8_length(byte)
+        try:
+            out.append(raw[i:i + size].decode('utf-8'))
+            i += size
+        except UnicodeDecodeError:
+            out.append(f"%{byte:02X}")
+            i += 1
+    return ''.join(out)
+
+def decode_unreserved(path):
+    return PERCENT_ESCAPES.sub(_decode_escapes, path)
+
+def normalize_url(url, rules=None):
+    rules = rules or URL_NORMALIZATION
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+
+    query = parts.query
+    if host in rules.get('drop_query_hosts', []):
+        query = ''
+    elif host in rules.get('numeric_query_hosts', []) and query.isdigit():
+        query = ''
+    elif query:
+        drop = set(rules.get('drop_params', []))
+        kept = [pair for pair in query.split('&') if pair and pair.split('=', 1)[0] not in drop]
+        query = '&'.join(kept)
+
+    # パーセントエンコードの有無で別URL扱いにならないよう、パスは非予約文字とUTF-8の文字だけデコードした形にそろえる
+    return urlunsplit((scheme, netloc, decode_unreserved(parts.path) or '/', query, ''))
+
+def incoming_path(url):
+    url_hash = hashlib.md5(url.encode()).hexdigest()[:10]
+    return os.path.join(INCOMING_DIR, f"{url_hash}.pdf")
+
+def output_name(data):
+    # 原稿とHTMLのファイル名。一度決めた名前は、PDFの保存名（内容のハッシュ）が変わっても変えない
+    if data.get('output_name'):
+        return data['output_name']
+    # 名前を記録する前のエントリは公開済みのページ名を引き継ぐ。未生成なら従来と同じく URL の md5 から作る
+    if data.get('infographic_path'):
+        return os.path.splitext(os.path.basename(data['infographic_path']))[0]
+    return f"doc_{hashlib.md5(data['url'].encode()).hexdigest()[:10]}"
+
+def detach_output(processed, url):
+    # 同じ内容だったため別エントリの生成結果（出力名）を引き継いだエントリのPDFが変わったら、専用の名前に切り替える
+    # そのままだと再生成で、もう一方のエントリが指しているページと原稿を上書きしてしまう
+    data = processed[url]
+    name = output_name(data)
+    others = [other for key, other in processed.items() if key != url]
+    # 今も同じ内容のPDFを指すエントリとは、引き続き同じ出力を共有してよい
+    if not any(output_name(other) == name and other.get('local_path') != data['local_path'] for other in others):
+        return False
+    used = {output_name(other) for other in others}
+    candidate = f"doc_{hashlib.md5(data['url'].encode()).hexdigest()[:10]}"
+    if candidate in used:
+        material = f"{data['url']}#{data['local_path']}"
+        candidate = f"doc_{hashlib.md5(material.encode()).hexdigest()[:10]}"
+    data['output_name'] = candidate
+    # 引き継いだ生成結果は使えないので、未生成として作り直させる
+    for field in ('infographic_path', 'fingerprint'):
+        data.pop(field, None)
+    data['processed'] = False
+    return True
+
+def store_file(tmp_path):
+    # 内容の SHA-256 で保存する。同じ内容のファイルが既にあれば一時ファイルを捨てる
+    store = get_store()
+    sha256 = file_digest(tmp_path)
+    existing = store.get_blob(sha256)
+    if existing and os.path.exists(existing):
+        os.remove(tmp_path)
+        return sha256, existing
+    blob_path = os.path.join(DOWNLOAD_DIR, f"{sha256}.pdf")
+    os.replace(tmp_path, blob_path)
+    store.put_blob(sha256, blob_path, os.path.getsize(blob_path))
+    return sha256, blob_path
+
+def add_alias(url, sha256):
+    get_store().put_alias(normalize_url(url), sha256)
+
+def lookup(url):
+    # URLに対応する保存済みファイルのパスを返す
+    store = get_store()
+    sha256 = store.get_alias(normalize_url(url))
+    if not sha256:
+        return None
+    path = store.get_blob(sha256)
+    return path if path and os.path.exists(path) else None
+
+def register_legacy(processed):
+    # ハッシュ名導入前のファイル（doc_<URLのmd5>.pdf）は名前を変えずにそのまま登録する
+    store = get_store()
+    known = store.alias_urls()
+    for url, data in processed.items():
+        if normalize_url(url) in known:
+            continue
+        path = data.get('local_path')
+        if not path or not os.path.exists(path):
+            continue
+        sha256 = file_digest(path)
+        if not store.get_blob(sha256):
+            store.put_blob(sha256, path, os.path.getsize(path))
+        add_alias(url, sha256)
+
+def inherit_generated(processed, url):
+    # 同じ内容のPDFで生成済みのエントリがあれば、その生成結果を引き継ぐ
+    data = processed[url]
+    for other in processed.values():
+        if other is not data and other.get('processed') and other.get('local_path') == data['local_path']:
+            for field in ('processed', 'infographic_path', 'output_name', 'fingerprint'):
+                if field in other:
+                    data[field] = other[field]
+            return other
+    return None
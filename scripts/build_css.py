@@ -0,0 +1,486 @@
+import os
+import re
+import gzip
+import glob
+import hashlib
+import argparse
+import metrics
+
+# brotli は入っている環境でのみ .br を出力する
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+DOCS_DIR = os.path.join(REPO_DIR, 'docs')
+ASSETS_DIR = os.path.join(REPO_DIR, 'docs/assets')
+
+# ハッシュなしの site.css は、ビルド前に生成されたページからも参照できるよう常に最新版を置く
+STYLESHEET_NAME = 'site.css'
+STYLESHEET_PATTERN = re.compile(r'(href="(?:\.\./)?assets/)site(?:\.[0-9a-f]{10})?\.css"')
+# テンプレート変更前に生成されたページは Tailwind の CDN を読み込んでいる
+TAILWIND_CDN_TAG = '<script src="https://cdn.tailwindcss.com"></script>'
+CLASS_PATTERN = re.compile(r'class=\\?"([^"\\]*)')
+
+COMPRESS_EXTENSIONS = ('.html', '.css', '.json', '.js')
+
+BREAKPOINTS = {'sm': 640, 'md': 768, 'lg': 1024, 'xl': 1280, '2xl': 1536}
+
+# 各テンプレートに埋め込んでいた共通スタイル
+COMPONENT_CSS = """
+body { font-family: 'Noto Sans JP', sans-serif; background-color: #f1f5f9; color: #0f172a; }
+.hero-gradient { background: linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%); }
+.card { background: white; border-radius: 1.5rem; box-shadow: 0 10px 25px -5px rgba(0, 0, 0, 0.05); border: 1px solid #e2e8f0; }
+.accent-title { position: relative; display: inline-block; padding-bottom: 0.5rem; }
+.accent-title::after { content: ''; position: absolute; left: 0; bottom: 0; width: 40%; height: 4px; background: #3b82f6; border-radius: 2px; }
+
+/* Markdown Custom Styling */
+.content-area h3 { font-size: 1.125rem; font-weight: 700; color: #1e40af; margin-top: 1.5rem; margin-bottom: 0.75rem; }
+.content-area p { margin-bottom: 1rem; line-height: 1.7; color: #334155; }
+.content-area ul { list-style: none; padding-left: 0; margin-bottom: 1.25rem; }
+.content-area li { position: relative; padding-left: 1.5rem; margin-bottom: 0.5rem; }
+.content-area li::before { content: '•'; position: absolute; left: 0; color: #3b82f6; font-weight: bold; }
+
+/* Specific Layout Components */
+.date-box { background: #eff6ff; border-left: 6px solid #2563eb; padding: 1.5rem; border-radius: 0.75rem; }
+.expense-item { background: #f8fafc; border: 1px solid #e2e8f0; padding: 1rem; border-radius: 0.75rem; transition: all 0.2s; }
+.expense-item:hover { border-color: #3b82f6; background: #f0f9ff; }
+
+.highlight-card { background: linear-gradient(to right, #ffffff, #f0f9ff); border-left: 8px solid #3b82f6; }
+"""
+
+# Tailwind の preflight のうち、生成ページが依存している部分
+PREFLIGHT_CSS = """
+*, ::before, ::after { box-sizing: border-box; border-width: 0; border-style: solid; border-color: #e5e7eb;
+    --tw-shadow: 0 0 #0000; --tw-shadow-colored: 0 0 #0000; }
+html { line-height: 1.5; -webkit-text-size-adjust: 100%; tab-size: 4;
+    font-family: ui-sans-serif, system-ui, sans-serif, "Apple Color Emoji", "Segoe UI Emoji"; }
+body { margin: 0; line-height: inherit; }
+h1, h2, h3, h4, h5, h6 { font-size: inherit; font-weight: inherit; }
+a { color: inherit; text-decoration: inherit; }
+b, strong { font-weight: bolder; }
+blockquote, dl, dd, h1, h2, h3, h4, h5, h6, hr, figure, p, pre { margin: 0; }
+ol, ul, menu { list-style: none; margin: 0; padding: 0; }
+img, svg, video, canvas, audio, iframe, embed, object { display: block; vertical-align: middle; }
+img, video { max-width: 100%; height: auto; }
+table { text-indent: 0; border-color: inherit; border-collapse: collapse; }
+button, input, select, textarea { font: inherit; color: inherit; margin: 0; padding: 0; }
+[hidden] { display: none; }
+"""
+
+COLORS = {
+    'slate': ['#f8fafc', '#f1f5f9', '#e2e8f0', '#cbd5e1', '#94a3b8', '#64748b', '#475569', '#334155', '#1e293b', '#0f172a', '#020617'],
+    'gray': ['#f9fafb', '#f3f4f6', '#e5e7eb', '#d1d5db', '#9ca3af', '#6b7280', '#4b5563', '#374151', '#1f2937', '#111827', '#030712'],
+    'red': ['#fef2f2', '#fee2e2', '#fecaca', '#fca5a5', '#f87171', '#ef4444', '#dc2626', '#b91c1c', '#991b1b', '#7f1d1d', '#450a0a'],
+    'amber': ['#fffbeb', '#fef3c7', '#fde68a', '#fcd34d', '#fbbf24', '#f59e0b', '#d97706', '#b45309', '#92400e', '#78350f', '#451a03'],
+    'yellow': ['#fefce8', '#fef9c3', '#fef08a', '#fde047', '#facc15', '#eab308', '#ca8a04', '#a16207', '#854d0e', '#713f12', '#422006'],
+    'green': ['#f0fdf4', '#dcfce7', '#bbf7d0', '#86efac', '#4ade80', '#22c55e', '#16a34a', '#15803d', '#166534', '#14532d', '#052e16'],
+    'emerald': ['#ecfdf5', '#d1fae5', '#a7f3d0', '#6ee7b7', '#34d399', '#10b981', '#059669', '#047857', '#065f46', '#064e3b', '#022c22'],
+    'blue': ['#eff6ff', '#dbeafe', '#bfdbfe', '#93c5fd', '#60a5fa', '#3b82f6', '#2563eb', '#1d4ed8', '#1e40af', '#1e3a8a', '#172554'],
+    'indigo': ['#eef2ff', '#e0e7ff', '#c7d2fe', '#a5b4fc', '#818cf8', '#6366f1', '#4f46e5', '#4338ca', '#3730a3', '#312e81', '#1e1b4b'],
+}
+SHADES = ['50', '100', '200', '300', '400', '500', '600', '700', '800', '900', '950']
+NAMED_COLORS = {'white': '#ffffff', 'black': '#000000'}
+
+FONT_SIZES = {
+    'xs': ('0.75rem', '1rem'), 'sm': ('0.875rem', '1.25rem'), 'base': ('1rem', '1.5rem'),
+    'lg': ('1.125rem', '1.75rem'), 'xl': ('1.25rem', '1.75rem'), '2xl': ('1.5rem', '2rem'),
+    '3xl': ('1.875rem', '2.25rem'), '4xl': ('2.25rem', '2.5rem'), '5xl': ('3rem', '1'),
+    '6xl': ('3.75rem', '1'), '7xl': ('4.5rem', '1'), '8xl': ('6rem', '1'), '9xl': ('8rem', '1'),
+}
+FONT_WEIGHTS = {'thin': 100, 'extralight': 200, 'light': 300, 'normal': 400, 'medium': 500,
+                'semibold': 600, 'bold': 700, 'extrabold': 800, 'black': 900}
+LEADING = {'none': '1', 'tight': '1.25', 'snug': '1.375', 'normal': '1.5', 'relaxed': '1.625', 'loose': '2'}
+TRACKING = {'tighter': '-0.05em', 'tight': '-0.025em', 'normal': '0em', 'wide': '0.025em',
+            'wider': '0.05em', 'widest': '0.1em'}
+RADII = {'none': '0px', 'sm': '0.125rem', '': '0.25rem', 'md': '0.375rem', 'lg': '0.5rem',
+         'xl': '0.75rem', '2xl': '1rem', '3xl': '1.5rem', 'full': '9999px'}
+MAX_WIDTHS = {'xs': '20rem', 'sm': '24rem', 'md': '28rem', 'lg': '32rem', 'xl': '36rem', '2xl': '42rem',
+              '3xl': '48rem', '4xl': '56rem', '5xl': '64rem', '6xl': '72rem', '7xl': '80rem', 'full': '100%'}
+SHADOWS = {
+    'sm': '0 1px 2px 0 rgb(0 0 0 / 0.05)',
+    '': '0 1px 3px 0 rgb(0 0 0 / 0.1), 0 1px 2px -1px rgb(0 0 0 / 0.1)',
+    'md': '0 4px 6px -1px rgb(0 0 0 / 0.1), 0 2px 4px -2px rgb(0 0 0 / 0.1)',
+    'lg': '0 10px 15px -3px rgb(0 0 0 / 0.1), 0 4px 6px -4px rgb(0 0 0 / 0.1)',
+    'xl': '0 20px 25px -5px rgb(0 0 0 / 0.1), 0 8px 10px -6px rgb(0 0 0 / 0.1)',
+    '2xl': '0 25px 50px -12px rgb(0 0 0 / 0.25)',
+    'none': '0 0 #0000',
+}
+BLURS = {'none': '0', 'sm': '4px', '': '8px', 'md': '12px', 'lg': '16px', 'xl': '24px', '2xl': '40px', '3xl': '64px'}
+BORDER_WIDTHS = {'': '1px', '0': '0px', '2': '2px', '4': '4px', '8': '8px'}
+DISPLAYS = {'block': 'block', 'inline-block': 'inline-block', 'inline': 'inline', 'flex': 'flex',
+            'inline-flex': 'inline-flex', 'grid': 'grid', 'hidden': 'none'}
+TRANSITIONS = {
+    '': 'color, background-color, border-color, text-decoration-color, fill, stroke, opacity, box-shadow, transform, filter, backdrop-filter',
+    'all': 'all',
+    'colors': 'color, background-color, border-color, text-decoration-color, fill, stroke',
+    'shadow': 'box-shadow',
+    'opacity': 'opacity',
+    'transform': 'transform',
+}
+SIDES = {'t': ['top'], 'r': ['right'], 'b': ['bottom'], 'l': ['left'],
+         'x': ['left', 'right'], 'y': ['top', 'bottom'], '': None}
+
+# 任意値 [..] の色として扱う書式（それ以外は長さとして扱う）
+# 出力順。Tailwind と同じくユーティリティの種類（プラグイン）の順に並べ、後に出る側が同じプロパティを上書きする
+# （text-lg などの文字サイズが設定する line-height を leading-* で上書きできるよう、font-size を line-height より前に置く）
+PROPERTY_ORDER = [
+    'position', 'inset', 'z-index', 'grid-column', 'margin', '-webkit-line-clamp', 'display', 'height', 'width',
+    'max-width', 'flex', 'transform', 'grid-template-columns', 'flex-direction', 'flex-wrap', 'align-items',
+    'justify-content', 'gap', 'overflow', 'border-radius', 'border-width', 'border-style', 'border-color',
+    'background-color', 'padding', 'text-align', 'font-size', 'font-weight', 'text-transform', 'font-style',
+    'line-height', 'letter-spacing', 'color', 'text-decoration-line', 'opacity', '--tw-shadow', '--tw-shadow-color',
+    '-webkit-backdrop-filter', 'transition-property',
+]
+# 辺ごとのプロパティは元のプロパティと同じ位置に並べる
+PROPERTY_FAMILIES = [
+    (re.compile(r'(margin|padding)-\w+'), r'\1'),
+    (re.compile(r'border-\w+-(width|color)'), r'border-\1'),
+    (re.compile(r'top|right|bottom|left'), 'inset'),
+    (re.compile(r'(?:column|row)-gap'), 'gap'),
+]
+
+ARBITRARY_COLOR = re.compile(r'#[0-9a-fA-F]{3,8}|(?:rgba?|hsla?)\(.+\)')
+ARBITRARY_LENGTH = re.compile(r'-?[\d.]+[a-z%]*|(?:calc|clamp|min|max|var)\(.+\)')
+
+def arbitrary(value):
+    # [..] の中身を返す（Tailwind と同じく _ は空白）。ルールを閉じられる文字を含む値は使わない
+    if len(value) < 3 or not (value.startswith('[') and value.endswith(']')):
+        return None
+    inner = value[1:-1].replace('_', ' ')
+    return None if re.search(r'[;{}<>]', inner) else inner
+
+def spacing(value, fractions=False):
+    # 数値（0.25rem 単位）・px・任意値を長さにする。fractions=True なら 1/2 などの分数も受け付ける。解釈できなければ None
+    if value == 'px':
+        return '1px'
+    if value.startswith('['):
+        inner = arbitrary(value)
+        return inner if inner and ARBITRARY_LENGTH.fullmatch(inner) else None
+    m = re.fullmatch(r'(\d+)/(\d+)', value)
+    if m:
+        numerator, denominator = int(m.group(1)), int(m.group(2))
+        return f"{numerator / denominator * 100:g}%" if fractions and denominator else None
+    if not re.fullmatch(r'\d+(?:\.\d+)?', value):
+        return None
+    number = float(value)
+    if number == 0:
+        return '0px'
+    return f"{number * 0.25:g}rem"
+
+def color(value):
+    # 'blue-600' / 'white/20' / '[#1e40af]' のような指定を CSS の色に変換する。色でなければ None
+    if value.startswith('['):
+        inner = arbitrary(value)
+        return inner if inner and ARBITRARY_COLOR.fullmatch(inner) else None
+    name, _, opacity = value.partition('/')
+    if opacity and not opacity.isdigit():
+        return None
+    if name in NAMED_COLORS:
+        hex_color = NAMED_COLORS[name]
+    elif name == 'transparent':
+        return 'transparent'
+    else:
+        family, _, shade = name.rpartition('-')
+        if family not in COLORS or shade not in SHADES:
+            return None
+        hex_color = COLORS[family][SHADES.index(shade)]
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    if opacity:
+        return f"rgb({r} {g} {b} / {int(opacity) / 100:g})"
+    return f"rgb({r} {g} {b})"
+
+def box(prefix, side, value):
+    sides = SIDES[side]
+    if sides is None:
+        return [(prefix, value)]
+    return [(f"{prefix}-{name}", value) for name in sides]
+
+def utility(name):
+    # クラス名を (宣言のリスト, 子孫セレクタ) に変換する。未対応なら None
+    negative = name.startswith('-')
+    base = name[1:] if negative else name
+
+    def signed(value):
+        if value is None:
+            return None
+        return f"-{value}" if negative and value != '0px' else value
+
+    m = re.fullmatch(r'([pm])([trblxy]?)-(.+)', base)
+    if m:
+        prefix = 'padding' if m.group(1) == 'p' else 'margin'
+        if m.group(3) == 'auto':
+            return box(prefix, m.group(2), 'auto'), ''
+        value = signed(spacing(m.group(3)))
+        return (box(prefix, m.group(2), value), '') if value else None
+    m = re.fullmatch(r'space-([xy])-(.+)', base)
+    if m:
+        prop = 'margin-left' if m.group(1) == 'x' else 'margin-top'
+        value = signed(spacing(m.group(2)))
+        return ([(prop, value)], ' > :not([hidden]) ~ :not([hidden])') if value else None
+    m = re.fullmatch(r'gap(?:-([xy]))?-(.+)', base)
+    if m:
+        prop = {'x': 'column-gap', 'y': 'row-gap', None: 'gap'}[m.group(1)]
+        value = spacing(m.group(2))
+        return ([(prop, value)], '') if value else None
+    m = re.fullmatch(r'(top|right|bottom|left|inset)-(.+)', base)
+    if m:
+        sides = ['top', 'right', 'bottom', 'left'] if m.group(1) == 'inset' else [m.group(1)]
+        value = signed(spacing(m.group(2), fractions=True)) if m.group(2) != 'auto' else 'auto'
+        return ([(side, value) for side in sides], '') if value else None
+    m = re.fullmatch(r'([wh])-(.+)', base)
+    if m:
+        prop = 'width' if m.group(1) == 'w' else 'height'
+        keywords = {'full': '100%', 'auto': 'auto', 'screen': '100vw' if m.group(1) == 'w' else '100vh',
+                    'min': 'min-content', 'max': 'max-content', 'fit': 'fit-content'}
+        value = keywords.get(m.group(2)) or spacing(m.group(2), fractions=True)
+        return ([(prop, value)], '') if value else None
+    m = re.fullmatch(r'max-w-(.+)', base)
+    if m and m.group(1) in MAX_WIDTHS:
+        return [('max-width', MAX_WIDTHS[m.group(1)])], ''
+    m = re.fullmatch(r'z-(\d+)', base)
+    if m:
+        return [('z-index', m.group(1))], ''
+    m = re.fullmatch(r'text-(.+)', base)
+    if m:
+        value = m.group(1)
+        if value in FONT_SIZES:
+            size, line_height = FONT_SIZES[value]
+            return [('font-size', size), ('line-height', line_height)], ''
+        if value in ('left', 'center', 'right', 'justify'):
+            return [('text-align', value)], ''
+        if value.startswith('['):
+            # text-[#123] は色、text-[13px] は文字サイズ
+            css_color = color(value)
+            if css_color:
+                return [('color', css_color)], ''
+            size = spacing(value)
+            return ([('font-size', size)], '') if size else None
+        css_color = color(value)
+        return ([('color', css_color)], '') if css_color else None
+    m = re.fullmatch(r'bg-(.+)', base)
+    if m:
+        css_color = color(m.group(1))
+        return ([('background-color', css_color)], '') if css_color else None
+    m = re.fullmatch(r'border(?:-([trbl]))?(?:-(.+))?', base)
+    if m:
+        side, value = m.group(1), m.group(2) or ''
+        prefix = f"border-{SIDES[side][0]}" if side else 'border'
+        if value in BORDER_WIDTHS:
+            return [(f"{prefix}-width", BORDER_WIDTHS[value])], ''
+        if not side and value in ('none', 'solid', 'dashed', 'dotted'):
+            return [('border-style', value)], ''
+        css_color = color(value)
+        return ([(f"{prefix}-color", css_color)], '') if css_color else None
+    m = re.fullmatch(r'rounded(?:-(.+))?', base)
+    if m:
+        value = m.group(1) or ''
+        if value.startswith('['):
+            radius = spacing(value)
+            return ([('border-radius', radius)], '') if radius else None
+        return ([('border-radius', RADII[value])], '') if value in RADII else None
+    m = re.fullmatch(r'shadow(?:-(.+))?', base)
+    if m:
+        value = m.group(1) or ''
+        if value in SHADOWS:
+            colored = re.sub(r'rgb\(0 0 0 / [\d.]+\)', 'var(--tw-shadow-color)', SHADOWS[value])
+            return [('--tw-shadow', SHADOWS[value]), ('--tw-shadow-colored', colored),
+                    ('box-shadow', 'var(--tw-ring-offset-shadow, 0 0 #0000), var(--tw-ring-shadow, 0 0 #0000), var(--tw-shadow)')], ''
+        css_color = color(value)
+        return ([('--tw-shadow-color', css_color), ('--tw-shadow', 'var(--tw-shadow-colored)')], '') if css_color else None
+    m = re.fullmatch(r'font-(.+)', base)
+    if m and m.group(1) in FONT_WEIGHTS:
+        return [('font-weight', str(FONT_WEIGHTS[m.group(1)]))], ''
+    m = re.fullmatch(r'leading-(.+)', base)
+    if m and m.group(1) in LEADING:
+        return [('line-height', LEADING[m.group(1)])], ''
+    m = re.fullmatch(r'tracking-(.+)', base)
+    if m and m.group(1) in TRACKING:
+        return [('letter-spacing', TRACKING[m.group(1)])], ''
+    m = re.fullmatch(r'grid-cols-(\d+)', base)
+    if m:
+        return [('grid-template-columns', f"repeat({m.group(1)}, minmax(0, 1fr))")], ''
+    m = re.fullmatch(r'col-span-(\d+)', base)
+    if m:
+        return [('grid-column', f"span {m.group(1)} / span {m.group(1)}")], ''
+    m = re.fullmatch(r'rotate-(\d+)', base)
+    if m:
+        return [('transform', f"rotate({signed(m.group(1))}deg)")], ''
+    m = re.fullmatch(r'backdrop-blur(?:-(.+))?', base)
+    if m and (m.group(1) or '') in BLURS:
+        blur = f"blur({BLURS[m.group(1) or '']})"
+        return [('-webkit-backdrop-filter', blur), ('backdrop-filter', blur)], ''
+    m = re.fullmatch(r'line-clamp-(\d+)', base)
+    if m:
+        return [('-webkit-line-clamp', m.group(1)), ('overflow', 'hidden'), ('display', '-webkit-box'),
+                ('-webkit-box-orient', 'vertical')], ''
+    m = re.fullmatch(r'opacity-(\d+)', base)
+    if m:
+        return [('opacity', f"{int(m.group(1)) / 100:g}")], ''
+    m = re.fullmatch(r'transition(?:-(.+))?', base)
+    if m and (m.group(1) or '') in TRANSITIONS:
+        return [('transition-property', TRANSITIONS[m.group(1) or '']),
+                ('transition-timing-function', 'cubic-bezier(0.4, 0, 0.2, 1)'),
+                ('transition-duration', '150ms')], ''
+    simple = {
+        'absolute': [('position', 'absolute')], 'relative': [('position', 'relative')],
+        'fixed': [('position', 'fixed')], 'sticky': [('position', 'sticky')],
+        'flex-1': [('flex', '1 1 0%')], 'flex-wrap': [('flex-wrap', 'wrap')], 'flex-col': [('flex-direction', 'column')],
+        'items-center': [('align-items', 'center')], 'items-start': [('align-items', 'flex-start')],
+        'justify-center': [('justify-content', 'center')], 'justify-between': [('justify-content', 'space-between')],
+        'overflow-hidden': [('overflow', 'hidden')], 'uppercase': [('text-transform', 'uppercase')],
+        'underline': [('text-decoration-line', 'underline')], 'italic': [('font-style', 'italic')],
+    }
+    if base in DISPLAYS:
+        return [('display', DISPLAYS[base])], ''
+    if base in simple:
+        return simple[base], ''
+    return None
+
+def escape(name):
+    return re.sub(r'([^a-zA-Z0-9_-])', r'\\\1', name)
+
+def property_rank(prop):
+    # 宣言の先頭のプロパティでユーティリティの種類を決める。表にないものは最後に置く
+    for pattern, family in PROPERTY_FAMILIES:
+        if pattern.fullmatch(prop):
+            prop = pattern.sub(family, prop)
+            break
+    return PROPERTY_ORDER.index(prop) if prop in PROPERTY_ORDER else len(PROPERTY_ORDER)
+
+def build_utilities(classes):
+    # 使われているクラスだけを生成する。ブレークポイントごとにまとめ、基本→sm→md→lg… の順で出力する
+    # 各グループ内はユーティリティの種類順（同じ種類の中はクラス名順）に並べる
+    groups = {None: []}
+    for breakpoint in BREAKPOINTS:
+        groups[breakpoint] = []
+
+    for name in sorted(classes):
+        variants = name.split(':')
+        utility_name = variants.pop()
+        breakpoint, pseudo = None, ''
+        supported = True
+        for variant in variants:
+            if variant in BREAKPOINTS and breakpoint is None:
+                breakpoint = variant
+            elif variant == 'hover':
+                pseudo = ':hover'
+            else:
+                supported = False
+        result = utility(utility_name) if supported else None
+        if not result:
+            continue
+        declarations, suffix = result
+        body = ';'.join(f"{prop}:{value}" for prop, value in declarations)
+        groups[breakpoint].append((property_rank(declarations[0][0]), name,
+                                   f".{escape(name)}{pseudo}{suffix}{{{body}}}"))
+
+    for breakpoint, rules in groups.items():
+        groups[breakpoint] = [rule for _, _, rule in sorted(rules)]
+
+    css = ''.join(groups[None])
+    for breakpoint, width in BREAKPOINTS.items():
+        if groups[breakpoint]:
+            css += f"@media (min-width:{width}px){{{''.join(groups[breakpoint])}}}"
+    return css
+
+def minify(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>~])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+def collect_classes(paths):
+    classes = set()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for match in CLASS_PATTERN.finditer(f.read()):
+                classes.update(match.group(1).split())
+    return classes
+
+def output_files():
+    html = glob.glob(os.path.join(DOCS_DIR, '**', '*.html'), recursive=True)
+    shards = glob.glob(os.path.join(DOCS_DIR, 'index', '*.json'))
+    return html, shards
+
+def write_stylesheet(css):
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    digest = hashlib.sha256(css.encode('utf-8')).hexdigest()[:10]
+    name = f"site.{digest}.css"
+    for path in (os.path.join(ASSETS_DIR, name), os.path.join(ASSETS_DIR, STYLESHEET_NAME)):
+        # 内容が同じなら書き直さず、圧縮ファイルも作り直さない
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == css:
+                    continue
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(css)
+    # 古いハッシュ付きスタイルシートを消す
+    for path in glob.glob(os.path.join(ASSETS_DIR, 'site.*.css*')):
+        if not os.path.basename(path).startswith(name) and not os.path.basename(path).startswith(STYLESHEET_NAME):
+            os.remove(path)
+    return name
+
+def link_stylesheet(paths, name):
+    # 変更があったページだけを書き換える
+    rewritten = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        updated = STYLESHEET_PATTERN.sub(lambda m: f'{m.group(1)}{name}"', content)
+        if TAILWIND_CDN_TAG in updated:
+            href = os.path.relpath(os.path.join(ASSETS_DIR, name), os.path.dirname(path))
+            updated = updated.replace(TAILWIND_CDN_TAG, f'<link rel="stylesheet" href="{href}">')
+        if updated != content:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(updated)
+            rewritten.append(path)
+    return rewritten
+
+def precompress(root=None):
+    # ソースより新しい圧縮ファイルがあれば作り直さない
+    written = []
+    for path in glob.glob(os.path.join(root or DOCS_DIR, '**', '*'), recursive=True):
+        if not path.endswith(COMPRESS_EXTENSIONS):
+            continue
+        mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            data = None
+            targets = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+            for suffix, compress in targets:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                if data is None:
+                    data = f.read()
+                with open(target, 'wb') as out:
+                    out.write(compress(data))
+                written.append(target)
+    return written
+
+def main(compress=True):
+    html, shards = output_files()
+    classes = collect_classes(html + shards)
+    css = minify(PREFLIGHT_CSS + COMPONENT_CSS) + build_utilities(classes)
+    name = write_stylesheet(css)
+    rewritten = link_stylesheet(html, name)
+    print(f"Stylesheet {name}: {len(css)} bytes from {len(classes)} classes, {len(rewritten)} pages relinked")
+    compressed = precompress() if compress else []
+    if compress:
+        print(f"Precompressed {len(compressed)} files")
+    # 公開ステージがこの実行で書き換えたファイルだけをステージできるように返す
+    return rewritten + compressed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='生成済みHTMLで使われているクラスだけのCSSを作る')
+    parser.add_argument('--no-compress', dest='compress', action='store_false', help='.gz/.br を出力しない')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    with metrics.stage('build_css'):
+        main(compress=args.compress)
+    metrics.export('build_css')
@@ -1,130 +1,324 @@
 import os
 import json
-import subprocess
-import hashlib
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import argparse
+import threading
+from crawler import HostPool
+from crawl_cache import CrawlCache
+from links import detect_encoding, extract_pdf_links
+from state import load_processed, save_entry
+import metrics
+import blobstore
 
-URLS_FILE = '/home/ubuntu/manus-infographic/data/urls.txt'
-PROCESSED_FILE = '/home/ubuntu/manus-infographic/data/processed_files.json'
-DOWNLOAD_DIR = '/home/ubuntu/manus-infographic/data/downloads'
+# ブラウザ経由のダウンロードは selenium がある環境でのみ使う
+try:
+    import download_with_browser
+except ImportError:
+    download_with_browser = None
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+URLS_FILE = os.path.join(REPO_DIR, 'data/urls.txt')
+DOWNLOAD_DIR = os.path.join(REPO_DIR, 'data/downloads')
+PDF_VALIDATION_FILE = os.path.join(REPO_DIR, 'data/pdf_validation.json')
 
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 
-def load_processed():
-    if os.path.exists(PROCESSED_FILE):
-        try:
-            with open(PROCESSED_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                return json.loads(content) if content else {}
-        except Exception:
-            return {}
-    return {}
+# クロール全体の並列数と、ホストごとの同時接続数・リクエスト間隔（秒）
+CRAWL_WORKERS = 8
+CONNECTIONS_PER_HOST = 2
+HOST_MIN_INTERVAL = 0.5
 
-def save_processed(data):
-    with open(PROCESSED_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# PDFヘッダーはファイル先頭1KB以内、%%EOF は末尾付近にあるため、その範囲だけを読む
+PDF_HEAD_BYTES = 1024
+PDF_TAIL_BYTES = 4096
 
-def is_valid_pdf(path):
-    if not os.path.exists(path):
-        return False
+_validation_cache = None
+_validation_lock = threading.Lock()
+
+def load_validation_cache():
+    global _validation_cache
+    if _validation_cache is None:
+        _validation_cache = {}
+        if os.path.exists(PDF_VALIDATION_FILE):
+            try:
+                with open(PDF_VALIDATION_FILE, 'r', encoding='utf-8') as f:
+                    _validation_cache = json.load(f)
+            except Exception:
+                _validation_cache = {}
+    return _validation_cache
+
+def save_validation_cache():
+    if _validation_cache is None:
+        return
+    with _validation_lock:
+        with open(PDF_VALIDATION_FILE, 'w', encoding='utf-8') as f:
+            json.dump(_validation_cache, f, ensure_ascii=False)
+
+def check_pdf(path):
+    # 'ok' / 'missing' / 'empty' / 'not_pdf' / 'truncated' のいずれかを返す
     try:
-        result = subprocess.run(['file', path], capture_output=True, text=True)
-        return 'PDF document' in result.stdout
-    except Exception:
-        return False
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    
+    # サイズと更新時刻が前回と同じなら、ファイルを開かずに前回の結果を使う
+    cache = load_validation_cache()
+    key = os.path.abspath(path)
+    cached = cache.get(key)
+    if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+        return cached['result']
+    
+    if stat.st_size == 0:
+        result = 'empty'
+    else:
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(PDF_HEAD_BYTES)
+                f.seek(max(0, stat.st_size - PDF_TAIL_BYTES))
+                tail = f.read(PDF_TAIL_BYTES)
+        except OSError:
+            return 'missing'
+        if b'%PDF-' not in head:
+            result = 'not_pdf'
+        elif b'%%EOF' not in tail:
+            result = 'truncated'
+        else:
+            result = 'ok'
+    
+    with _validation_lock:
+        cache[key] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'result': result}
+    return result
 
-def get_pdf_links(url):
+def is_valid_pdf(path):
+    return check_pdf(path) == 'ok'
+
+def create_pool():
+    return HostPool(USER_AGENT, connections_per_host=CONNECTIONS_PER_HOST, min_interval=HOST_MIN_INTERVAL)
+
+def get_pdf_links(url, pool, cache=None):
     try:
-        response = requests.get(url, headers={'User-Agent': USER_AGENT}, timeout=15)
+        cached = cache.get('pages', url) if cache else None
+        headers = cache.conditional_headers('pages', url) if cached else None
+        response = pool.get(url, headers=headers)
         response.raise_for_status()
         
-        # エンコーディングを明示的に設定（chardetが失敗する場合に備え）
-        if response.encoding is None or response.encoding == 'ISO-8859-1':
-            response.encoding = response.apparent_encoding
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = []
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            clean_href = href.split('?')[0]
-            if clean_href.lower().endswith('.pdf'):
-                full_url = urljoin(url, href)
-                text = a.get_text(strip=True) or os.path.basename(urlparse(full_url).path)
-                
-                # IT導入補助金の場合は公募要領のみに絞る
-                if 'it-shien.smrj.go.jp' in full_url:
-                    if 'koubo' not in full_url:
-                        continue
-                
-                links.append({'url': full_url, 'text': text})
+        # 一覧ページが更新されていなければ、前回解析したリンクをそのまま使う
+        if cached and response.status_code == 304:
+            cache.record('pages', hit=True)
+            return cached['links']
+        
+        # 文字コードはホストごとに覚えておき、本文全体の推定は初回だけにする
+        encoding = detect_encoding(response, cached.get('encoding') if cached else None)
+        response.encoding = encoding
+        links = extract_pdf_links(response.text, url)
+        
+        if cache:
+            cache.record('pages', hit=False)
+            cache.store('pages', url, response, links=links, encoding=encoding)
         return links
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return []
 
-def download_pdf_with_curl(url, filename, referer):
-    path = os.path.join(DOWNLOAD_DIR, filename)
+def download_pdf(url, referer, pool, cache=None, current_path=None):
+    # 一時ファイルに取得して検証し、内容のハッシュ名で保存する
+    tmp_path = blobstore.incoming_path(url)
+    headers = {'Referer': referer}
+    # 手元に有効なファイルがある場合のみ条件付きリクエストにする
+    revalidating = cache and current_path and is_valid_pdf(current_path)
+    if revalidating:
+        headers.update(cache.conditional_headers('pdfs', url))
     try:
-        cmd = [
-            'curl', '-L', '-A', USER_AGENT,
-            '-H', f'Referer: {referer}',
-            url, '-o', path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
+        response = pool.download(url, tmp_path, headers=headers)
+        
+        if revalidating and response.status_code == 304:
+            cache.record('pdfs', hit=True)
+            return current_path, False
         
-        if is_valid_pdf(path):
-            return path
+        result = check_pdf(tmp_path)
+        if result == 'ok':
+            sha256, path = blobstore.store_file(tmp_path)
+            blobstore.add_alias(url, sha256)
+            if cache:
+                cache.record('pdfs', hit=False)
+                cache.store('pdfs', url, response, sha256=sha256)
+            return path, path != current_path
         else:
-            print(f"Downloaded file is not a valid PDF: {url}")
-            if os.path.exists(path):
-                os.remove(path)
-            return None
+            if result == 'truncated':
+                print(f"Downloaded PDF is truncated: {url}")
+            else:
+                print(f"Downloaded file is not a valid PDF ({result}): {url}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            # ボット対策でHTMLが返るサイトなどはブラウザでの取得を試みる
+            if result == 'not_pdf':
+                return download_pdf_with_browser(url, current_path)
+            return None, False
     except Exception as e:
-        print(f"Error downloading with curl {url}: {e}")
+        print(f"Error downloading {url}: {e}")
+        return None, False
+
+def download_pdf_with_browser(url, current_path=None):
+    if download_with_browser is None:
+        return None, False
+    print(f"Retrying with browser: {url}")
+    tmp_path = blobstore.incoming_path(url)
+    path = download_with_browser.download_pdf_with_selenium(url, os.path.basename(tmp_path),
+                                                            os.path.dirname(tmp_path))
+    if path and is_valid_pdf(path):
+        sha256, path = blobstore.store_file(path)
+        blobstore.add_alias(url, sha256)
+        return path, path != current_path
+    if path and os.path.exists(path):
+        os.remove(path)
+    return None, False
+
+def close_browser_pool():
+    if download_with_browser is not None:
+        download_with_browser.close_pool()
+
+def find_entry(processed, url):
+    # 正規化したURLで引き、見つからなければ正規化導入前の生URLのキーで引く
+    key = blobstore.normalize_url(url)
+    if key in processed:
+        return key
+    if url in processed:
+        return url
+    return None
+
+def plan_download(processed, link, referer, revalidate=False):
+    # ダウンロードが必要なら job を、不要なら None を返す
+    pdf_url = link['url']
+    key = find_entry(processed, pdf_url) or blobstore.normalize_url(pdf_url)
+    current_path = None
+    
+    if key in processed:
+        data = processed[key]
+        if data.get('local_path') and is_valid_pdf(data['local_path']):
+            # --revalidate 時は同じURLで差し替えられたPDFを条件付きリクエストで検出する
+            if not revalidate:
+                return None
+            current_path = data['local_path']
+        else:
+            print(f"Redownloading invalid or missing PDF: {pdf_url}")
+    else:
+        # 別のURL表記で取得済みの内容なら、ダウンロードせずにそのファイルを使う
+        current_path = blobstore.lookup(pdf_url)
+        if current_path and is_valid_pdf(current_path) and not revalidate:
+            return {'link': link, 'referer': referer, 'key': key, 'current_path': current_path,
+                    'cached': True}
+    
+    return {'link': link, 'referer': referer, 'key': key, 'current_path': current_path}
+
+def run_download(job, pool, cache):
+    if job.get('cached'):
+        return job['current_path'], True
+    print(f"Attempting to download: {job['link']['url']}")
+    return download_pdf(job['link']['url'], job['referer'], pool, cache, job['current_path'])
+
+def record_download(processed, job, local_path, changed):
+    # 新規・更新されたエントリの processed 上のキー（正規化したURL）を返す。変化がなければ None
+    if not local_path:
         return None
+    link = job['link']
+    key = job['key']
+    if key in processed:
+        entry = processed[key]
+        if entry.get('local_path') == local_path and not changed:
+            return None
+        # 既存エントリは生成済みの情報を残し、再生成の要否はフィンガープリントで判定させる
+        print(f"PDF updated: {link['url']}")
+        # PDFの保存名が変わっても、公開済みのページと原稿の名前は変えない
+        entry.setdefault('output_name', blobstore.output_name(entry))
+        entry['local_path'] = local_path
+        entry['source'] = job['referer']
+        if blobstore.detach_output(processed, key):
+            print(f"Giving {link['url']} its own output name {entry['output_name']}")
+    else:
+        print(f"Successfully downloaded PDF: {link['url']}")
+        entry = {
+            'url': link['url'],
+            'text': link['text'],
+            'local_path': local_path,
+            'source': job['referer'],
+            'processed': False
+        }
+        entry['output_name'] = blobstore.output_name(entry)
+        processed[key] = entry
+    
+    # 別URLで同じ内容が要約済みなら、その結果を引き継いでLLM呼び出しを省く
+    twin = blobstore.inherit_generated(processed, key)
+    if twin is not None:
+        print(f"Identical to already processed PDF {twin['url']}")
+    
+    save_entry(key, entry)
+    return key
 
-def main():
+def load_urls():
     with open(URLS_FILE, 'r') as f:
-        urls = [line.strip() for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+def main(revalidate=False, processed=None, pool=None, urls=None):
+    # urls を渡すとその一覧ページだけを巡回する（スケジューラーからの呼び出し用）
+    if urls is None:
+        urls = load_urls()
 
-    processed = load_processed()
+    if processed is None:
+        processed = load_processed()
+    # 新規・更新されたエントリのキーを返す（エントリの 'url' は生URLなので、呼び出し側はこのキーで引く）
     new_pdfs = []
+    # 呼び出し元から渡されたプールは呼び出し元が閉じる
+    owns_pool = pool is None
+    if owns_pool:
+        pool = create_pool()
+    cache = CrawlCache()
+    blobstore.register_legacy(processed)
 
-    for url in urls:
-        print(f"Checking {url}...")
-        links = get_pdf_links(url)
-        for link in links:
-            pdf_url = link['url']
-            
-            if pdf_url in processed:
-                data = processed[pdf_url]
-                if data.get('local_path') and is_valid_pdf(data['local_path']):
+    try:
+        # 一覧ページは全ホストを並列に取得する
+        def crawl(url):
+            print(f"Checking {url}...")
+            return get_pdf_links(url, pool, cache)
+
+        pages = pool.map(crawl, urls, workers=CRAWL_WORKERS)
+
+        jobs = []
+        seen = set()
+        for url, links in zip(urls, pages):
+            for link in links:
+                key = blobstore.normalize_url(link['url'])
+                if key in seen:
                     continue
-                else:
-                    print(f"Redownloading invalid or missing PDF: {pdf_url}")
-            
-            print(f"Attempting to download: {pdf_url}")
-            url_hash = hashlib.md5(pdf_url.encode()).hexdigest()[:10]
-            filename = f"doc_{url_hash}.pdf"
-            
-            local_path = download_pdf_with_curl(pdf_url, filename, url)
-            if local_path:
-                print(f"Successfully downloaded PDF: {filename}")
-                entry = {
-                    'url': pdf_url,
-                    'text': link['text'],
-                    'local_path': local_path,
-                    'processed': False
-                }
-                processed[pdf_url] = entry
-                new_pdfs.append(entry)
-
-    save_processed(processed)
+                seen.add(key)
+                job = plan_download(processed, link, url, revalidate)
+                if job:
+                    jobs.append(job)
+
+        results = pool.map(lambda job: run_download(job, pool, cache), jobs,
+                           workers=CRAWL_WORKERS, key=lambda job: job['link']['url'])
+    finally:
+        if owns_pool:
+            pool.close()
+        close_browser_pool()
+
+    for job, (local_path, changed) in zip(jobs, results):
+        key = record_download(processed, job, local_path, changed)
+        if key:
+            new_pdfs.append(key)
+
+    save_validation_cache()
+    cache.save()
+    print(f"Crawl cache: {cache.report()}")
     return new_pdfs
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='一覧ページを巡回して新しいPDFをダウンロードする')
+    parser.add_argument('--revalidate', action='store_true', help='ダウンロード済みのPDFも条件付きリクエストで更新を確認する')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    with metrics.stage('check_pdfs'):
+        main(revalidate=args.revalidate)
+    metrics.export('check_pdfs')
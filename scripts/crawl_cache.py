@@ -0,0 +1,65 @@
+import os
+import json
+import threading
+import metrics
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+CRAWL_CACHE_FILE = os.path.join(REPO_DIR, 'data/crawl_cache.json')
+
+KINDS = ('pages', 'pdfs')
+
+class CrawlCache:
+    def __init__(self, path=CRAWL_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {kind: {} for kind in KINDS}
+        self.stats = {kind: {'hit': 0, 'miss': 0} for kind in KINDS}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                for kind in KINDS:
+                    self.data[kind].update(loaded.get(kind, {}))
+            except Exception as e:
+                print(f"Ignoring unreadable crawl cache {path}: {e}")
+
+    def get(self, kind, url):
+        with self.lock:
+            return self.data[kind].get(url)
+
+    def conditional_headers(self, kind, url):
+        entry = self.get(kind, url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, kind, url, response, **fields):
+        entry = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        entry.update(fields)
+        with self.lock:
+            self.data[kind][url] = entry
+
+    def record(self, kind, hit):
+        with self.lock:
+            self.stats[kind]['hit' if hit else 'miss'] += 1
+        metrics.incr('crawl_cache', kind=kind, result='hit' if hit else 'miss')
+
+    def report(self):
+        return ", ".join(
+            f"{kind}: {self.stats[kind]['hit']} hit / {self.stats[kind]['miss']} miss" for kind in KINDS
+        )
+
+    def save(self):
+        # 書き込み途中で落ちても既存のキャッシュが壊れないよう、一時ファイル経由で置き換える
+        tmp_path = self.path + '.tmp'
+        with self.lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
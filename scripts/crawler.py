@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+def interleave_by_host(items, key=lambda item: item):
+    # 同一ホストのジョブが連続しないよう、ホストごとのラウンドロビン順に並べ替える
+    buckets = {}
+    for index, item in enumerate(items):
+        buckets.setdefault(host_of(key(item)), []).append((index, item))
+    ordered = []
+    queues = list(buckets.values())
+    while queues:
+        for queue in queues:
+            ordered.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+class HostPool:
+    def __init__(self, user_agent, connections_per_host=2, min_interval=0.5, timeout=15):
+        self.user_agent = user_agent
+        self.connections_per_host = connections_per_host
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.semaphores = {}
+        self.next_start = {}
+
+    def session(self, url):
+        host = host_of(url)
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                # ホストごとに keep-alive セッションを保持し、TLSハンドシェイクを使い回す
+                session = requests.Session()
+                session.headers['User-Agent'] = self.user_agent
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[host] = session
+                self.semaphores[host] = threading.Semaphore(self.connections_per_host)
+            return session
+
+    @contextmanager
+    def slot(self, url):
+        # ホストごとの同時接続数と、リクエスト開始間隔（ポライトネス）を守る
+        self.session(url)
+        host = host_of(url)
+        with self.semaphores[host]:
+            with self.lock:
+                now = time.monotonic()
+                start = max(now, self.next_start.get(host, now))
+                self.next_start[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+    def get(self, url, headers=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self.slot(url):
+            with metrics.timer('http_get', host=host_of(url)):
+                response = self.session(url).get(url, headers=headers, **kwargs)
+        metrics.incr('pages_fetched', host=host_of(url), status=response.status_code)
+        return response
+
+    def download(self, url, path, headers=None):
+        # 一時ファイルへチャンク単位で書き出し、完了後にリネームする
+        # 304 Not Modified の場合は既存ファイルに触れずにレスポンスを返す
+        part_path = path + '.part'
+        try:
+            with self.slot(url), metrics.timer('http_download', host=host_of(url)):
+                with self.session(url).get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    metrics.incr('downloads', host=host_of(url), status=response.status_code)
+                    if response.status_code == 304:
+                        return response
+                    size = 0
+                    with open(part_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            size += len(chunk)
+                    metrics.incr('bytes_downloaded', size, host=host_of(url))
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        return response
+
+    def map(self, fn, items, workers=8, key=lambda item: item):
+        # 結果は入力順で返す
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [(index, executor.submit(fn, item)) for index, item in interleave_by_host(items, key)]
+            for index, future in futures:
+                results[index] = future.result()
+        return results
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
@@ -1,58 +1,149 @@
 import os
 import time
-import hashlib
+import queue
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 
-DOWNLOAD_DIR = '/home/ubuntu/manus-infographic/data/downloads'
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+DOWNLOAD_DIR = os.path.join(REPO_DIR, 'data/downloads')
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-def download_pdf_with_selenium(url, filename):
+# ブラウザ1台ごとの作業用ダウンロードディレクトリの置き場所
+BROWSER_WORK_DIR = os.path.join(DOWNLOAD_DIR, '.browser')
+
+POOL_SIZE = 2
+DOWNLOAD_TIMEOUT = 120
+POLL_INTERVAL = 0.2
+# ダウンロードが始まらない（.crdownload も現れない）まま待つ上限
+START_TIMEOUT = 20
+
+def create_driver(download_dir):
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
-    
+
     # PDFを直接ダウンロードするための設定
     prefs = {
-        "download.default_directory": DOWNLOAD_DIR,
+        "download.default_directory": download_dir,
         "download.prompt_for_download": False,
         "download.directory_upgrade": True,
         "plugins.always_open_pdf_externally": True
     }
     chrome_options.add_experimental_option("prefs", prefs)
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    try:
-        print(f"Navigating to {url}...")
-        driver.get(url)
-        
-        # ダウンロード完了を待つ（簡易的な実装）
-        time.sleep(10)
-        
-        # ダウンロードされた最新のファイルを探す
-        files = os.listdir(DOWNLOAD_DIR)
-        if not files:
+
+    return webdriver.Chrome(options=chrome_options)
+
+def wait_for_download(download_dir, timeout=DOWNLOAD_TIMEOUT, start_timeout=START_TIMEOUT):
+    # .crdownload が消えて完成ファイルだけが残った時点で完了とみなす
+    started = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - started
+        names = os.listdir(download_dir)
+        partial = [name for name in names if name.endswith('.crdownload') or name.endswith('.tmp')]
+        finished = [name for name in names if name not in partial and not name.startswith('.')]
+        if finished and not partial:
+            return os.path.join(download_dir, finished[0])
+        if elapsed > timeout or (not names and elapsed > start_timeout):
             return None
-        
-        # 最も新しいファイルを取得
-        latest_file = max([os.path.join(DOWNLOAD_DIR, f) for f in files], key=os.path.getctime)
-        
-        # 指定の名前にリネーム
-        new_path = os.path.join(DOWNLOAD_DIR, filename)
-        if os.path.exists(new_path):
-            os.remove(new_path)
-        os.rename(latest_file, new_path)
-        
-        return new_path
-    except Exception as e:
-        print(f"Selenium error: {e}")
-        return None
-    finally:
-        driver.quit()
+        time.sleep(POLL_INTERVAL)
+
+class BrowserSlot:
+    def __init__(self, index):
+        self.download_dir = tempfile.mkdtemp(prefix=f'slot{index}-', dir=BROWSER_WORK_DIR)
+        self.driver = None
+
+    def ensure_driver(self):
+        if self.driver is None:
+            self.driver = create_driver(self.download_dir)
+        return self.driver
+
+    def clear(self):
+        for name in os.listdir(self.download_dir):
+            os.remove(os.path.join(self.download_dir, name))
+
+    def reset(self):
+        # 異常終了したブラウザは破棄し、次回の利用時に起動し直す
+        self.quit()
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+class BrowserPool:
+    def __init__(self, size=POOL_SIZE):
+        os.makedirs(BROWSER_WORK_DIR, exist_ok=True)
+        self.slots = [BrowserSlot(i) for i in range(size)]
+        self.available = queue.Queue()
+        for slot in self.slots:
+            self.available.put(slot)
+
+    @contextmanager
+    def acquire(self):
+        slot = self.available.get()
+        try:
+            yield slot
+        finally:
+            self.available.put(slot)
+
+    def download(self, url, filename, dest_dir=DOWNLOAD_DIR):
+        with self.acquire() as slot:
+            slot.clear()
+            try:
+                print(f"Navigating to {url}...")
+                slot.ensure_driver().get(url)
+
+                downloaded = wait_for_download(slot.download_dir)
+                if not downloaded:
+                    print(f"Download did not complete in time: {url}")
+                    return None
+
+                # 指定の名前で保存先へ移動
+                new_path = os.path.join(dest_dir, filename)
+                shutil.move(downloaded, new_path)
+                return new_path
+            except Exception as e:
+                print(f"Selenium error: {e}")
+                slot.reset()
+                return None
+
+    def close(self):
+        for slot in self.slots:
+            slot.quit()
+            shutil.rmtree(slot.download_dir, ignore_errors=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def download_pdf_with_selenium(url, filename, dest_dir=DOWNLOAD_DIR):
+    return get_pool().download(url, filename, dest_dir)
 
 if __name__ == "__main__":
     # テスト用
     test_url = "https://www.jizokukanb.com/jizokuka_r6h/doc/kobo/r6_19/19_一般型_公募要領_第5版.pdf?28"
-    download_pdf_with_selenium(test_url, "test.pdf")
+    try:
+        download_pdf_with_selenium(test_url, "test.pdf")
+    finally:
+        close_pool()
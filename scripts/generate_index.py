@@ -1,8 +1,19 @@
 import os
 import json
+import hashlib
+from state import get_store
+import metrics
+import search_index
 
-PROCESSED_FILE = '/home/ubuntu/manus-infographic/data/processed_files.json'
-INDEX_PATH = '/home/ubuntu/manus-infographic/docs/index.html'
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+INDEX_PATH = os.path.join(REPO_DIR, 'docs/index.html')
+# 遅延読み込み用のマニフェストとシャード
+MANIFEST_PATH = os.path.join(REPO_DIR, 'docs/index.json')
+SHARD_DIR = os.path.join(REPO_DIR, 'docs/index')
+CARD_CACHE_FILE = os.path.join(REPO_DIR, 'data/index_cache.json')
+
+# 1シャードあたりのカード数。最新のシャードだけを index.html に埋め込む
+SHARD_SIZE = 24
 
 INDEX_TEMPLATE = """
 <!DOCTYPE html>
@@ -11,31 +22,173 @@ INDEX_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>資料インフォグラフィック一覧</title>
-    <script src="https://cdn.tailwindcss.com"></script>
     <link href="https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;700&display=swap" rel="stylesheet">
-    <style>
-        body {{ font-family: 'Noto Sans JP', sans-serif; background-color: #f1f5f9; }}
-    </style>
+    <link rel="stylesheet" href="assets/site.css">
 </head>
 <body class="p-4 md:p-12">
     <div class="max-w-5xl mx-auto">
         <header class="mb-12">
             <h1 class="text-4xl font-bold text-slate-900 mb-4">資料インフォグラフィック一覧</h1>
             <p class="text-slate-600 text-lg">追加されたPDF資料の要約をインフォグラフィック形式で閲覧できます。</p>
+            <div class="mt-8">
+                <input id="search" type="search" autocomplete="off" placeholder="対象者・経費・日程・注意点をキーワードで検索（例: 広報費）"
+                       class="w-full px-5 py-3 bg-white rounded-xl border border-slate-300 shadow-sm text-lg">
+                <p id="search-status" class="mt-2 text-sm text-slate-500"></p>
+            </div>
         </header>
 
-        <div class="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
+        <div id="results" class="grid md:grid-cols-2 lg:grid-cols-3 gap-6" style="display: none"></div>
+        <div id="cards" class="grid md:grid-cols-2 lg:grid-cols-3 gap-6">
             {items}
         </div>
+        <div id="more" class="h-10"></div>
 
         <footer class="mt-20 text-center text-slate-400">
             <p>&copy; 2026 Manus Infographic Automation System</p>
         </footer>
     </div>
+    <script>{script}</script>
 </body>
 </html>
 """
 
+# スクロールに応じて index.json のシャードを順に読み込む
+LAZY_LOAD_SCRIPT = """
+(function () {
+    var grid = document.getElementById('cards');
+    var sentinel = document.getElementById('more');
+    var shards = null, next = 0, loading = false;
+    function nearBottom() {
+        return sentinel.getBoundingClientRect().top < window.innerHeight + 600;
+    }
+    function load() {
+        if (loading) return;
+        loading = true;
+        var manifest = shards ? Promise.resolve(shards) : fetch('index.json').then(function (r) { return r.json(); }).then(function (m) { return shards = m.shards; });
+        manifest.then(function (list) {
+            if (next >= list.length) { observer.disconnect(); return; }
+            return fetch(list[next++]).then(function (r) { return r.json(); }).then(function (shard) {
+                grid.insertAdjacentHTML('beforeend', shard.cards.join(''));
+            });
+        }).finally(function () {
+            loading = false;
+            if (shards && next < shards.length && nearBottom()) load();
+        });
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) load();
+    }, { rootMargin: '600px' });
+    observer.observe(sentinel);
+})();
+"""
+
+# 検索語を index.json の search に載っているセグメントの転置索引で引く
+# 語の n-gram ごとにハッシュで決まるファイルだけを初回の検索時に読み込み、以降はメモリ上で引く
+SEARCH_SCRIPT = """
+(function () {
+    var input = document.getElementById('search');
+    var status = document.getElementById('search-status');
+    var results = document.getElementById('results');
+    var grid = document.getElementById('cards');
+    var more = document.getElementById('more');
+    var MAX_RESULTS = 60;
+    var files = {}, seq = 0, timer = null;
+    function load(path) {
+        if (!files[path]) files[path] = fetch(path).then(function (r) { return r.json(); });
+        return files[path];
+    }
+    function fnv1a(token) {
+        var h = 0x811c9dc5;
+        for (var i = 0; i < token.length; i++) {
+            var cp = token.codePointAt(i);
+            if (cp > 0xffff) i++;
+            h = Math.imul(h ^ cp, 0x01000193) >>> 0;
+        }
+        return h;
+    }
+    function tokenize(text, n) {
+        var grams = {};
+        (text.normalize('NFKC').toLowerCase().match(/[\\p{L}\\p{N}]+/gu) || []).forEach(function (word) {
+            var chars = Array.from(word);
+            if (chars.length <= n) { grams[word] = true; return; }
+            for (var i = 0; i + n <= chars.length; i++) grams[chars.slice(i, i + n).join('')] = true;
+        });
+        return Object.keys(grams);
+    }
+    function decode(deltas) {
+        var ids = new Array(deltas.length), id = 0;
+        for (var i = 0; i < deltas.length; i++) ids[i] = id += deltas[i];
+        return ids;
+    }
+    function intersect(a, b) {
+        var out = [], i = 0, j = 0;
+        while (i < a.length && j < b.length) {
+            if (a[i] === b[j]) { out.push(a[i]); i++; j++; }
+            else if (a[i] < b[j]) i++;
+            else j++;
+        }
+        return out;
+    }
+    function searchSegment(segment, grams, buckets) {
+        return Promise.all(grams.map(function (gram) {
+            var path = segment.buckets[fnv1a(gram) % buckets];
+            if (!path) return [];
+            return load(path).then(function (terms) { return terms[gram] ? decode(terms[gram]) : []; });
+        })).then(function (lists) {
+            lists.sort(function (a, b) { return a.length - b.length; });
+            var ids = lists.reduce(intersect);
+            if (!ids.length) return [];
+            return load(segment.docs).then(function (docs) {
+                return ids.reverse().map(function (id) { return docs[id]; });
+            });
+        });
+    }
+    function esc(text) {
+        return String(text).replace(/[&<>"']/g, function (c) { return '&#' + c.charCodeAt(0) + ';'; });
+    }
+    function card(doc) {
+        return '<div class="bg-white rounded-xl shadow-sm border border-slate-200 p-6 hover:shadow-md transition-shadow">' +
+            '<a href="' + esc(doc[1]) + '" class="block text-xl font-bold text-slate-800 hover:text-blue-700 line-clamp-2">' + esc(doc[0]) + '</a>' +
+            '<a href="' + esc(doc[2]) + '" target="_blank" class="inline-block mt-3 text-sm text-slate-400 hover:text-slate-600 underline">元資料(PDF)を開く</a>' +
+            '</div>';
+    }
+    function show(searching) {
+        results.style.display = searching ? '' : 'none';
+        grid.style.display = searching ? 'none' : '';
+        more.style.display = searching ? 'none' : '';
+    }
+    function search(query) {
+        var current = ++seq;
+        if (!query.trim()) { show(false); status.textContent = ''; return; }
+        var started = performance.now();
+        load('index.json').then(function (manifest) {
+            var index = manifest.search;
+            var grams = tokenize(query, index.ngram);
+            if (!grams.length) return [];
+            return Promise.all(index.segments.map(function (segment) {
+                return searchSegment(segment, grams, index.buckets);
+            })).then(function (found) {
+                // 新しいセグメントの資料から順に並べる
+                return [].concat.apply([], found.reverse());
+            });
+        }).then(function (hits) {
+            if (current !== seq) return;
+            results.innerHTML = hits.slice(0, MAX_RESULTS).map(card).join('');
+            status.textContent = hits.length + '件' + (hits.length > MAX_RESULTS ? '（新しい順に' + MAX_RESULTS + '件を表示）' : '') +
+                ' / ' + Math.round(performance.now() - started) + 'ms';
+            show(true);
+        }).catch(function () {
+            if (current === seq) status.textContent = '検索索引を読み込めませんでした';
+        });
+    }
+    input.addEventListener('focus', function () { load('index.json'); }, { once: true });
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () { search(input.value); }, 120);
+    });
+})();
+"""
+
 ITEM_TEMPLATE = """
 <div class="bg-white rounded-xl shadow-sm border border-slate-200 overflow-hidden hover:shadow-md transition-shadow">
     <div class="p-6">
@@ -54,29 +207,111 @@ ITEM_TEMPLATE = """
 </div>
 """
 
-def main():
-    if not os.path.exists(PROCESSED_FILE):
-        return
+TEMPLATE_DIGEST = hashlib.sha256(ITEM_TEMPLATE.encode('utf-8')).hexdigest()
 
-    with open(PROCESSED_FILE, 'r', encoding='utf-8') as f:
-        processed = json.load(f)
+def load_card_cache():
+    if os.path.exists(CARD_CACHE_FILE):
+        try:
+            with open(CARD_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {'cards': {}, 'shards': {}}
 
-    items_html = []
-    # 逆順（新しい順）に表示
-    for url, data in reversed(list(processed.items())):
-        if data.get('infographic_path'):
-            items_html.append(ITEM_TEMPLATE.format(
+def save_card_cache(cache):
+    tmp_path = CARD_CACHE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, CARD_CACHE_FILE)
+
+def card_key(url, data):
+    material = json.dumps([TEMPLATE_DIGEST, data['text'], data['infographic_path'], data.get('url', url)],
+                          ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def render_cards(processed, cache):
+    # 表示内容が変わったエントリのカードだけを作り直す
+    cards = []
+    rendered = 0
+    fresh = {}
+    # 同じ内容のPDF（別URL）のエントリは同じページを指すので、最初の1件だけをカードにする（検索索引と同じ）
+    seen_paths = set()
+    for url, data in processed.items():
+        if not data.get('infographic_path') or data['infographic_path'] in seen_paths:
+            continue
+        seen_paths.add(data['infographic_path'])
+        key = card_key(url, data)
+        cached = cache['cards'].get(url)
+        if not cached or cached['key'] != key:
+            cached = {'key': key, 'html': ITEM_TEMPLATE.format(
                 title=data['text'],
                 infographic_url=data['infographic_path'],
-                original_url=url
-            ))
+                original_url=data.get('url', url)
+            )}
+            rendered += 1
+        fresh[url] = cached
+        cards.append(cached)
+    cache['cards'] = fresh
+    return cards, rendered
 
-    full_html = INDEX_TEMPLATE.format(items="".join(items_html))
+def write_shards(shards, cache):
+    # シャードは古い順に固定幅で区切るため、新しい資料が増えても過去のシャードは変わらない
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    paths = []
+    written = 0
+    fresh = {}
+    for index, shard in enumerate(shards):
+        digest = hashlib.sha256(''.join(card['key'] for card in shard).encode('utf-8')).hexdigest()
+        cached = cache['shards'].get(str(index))
+        path = f"index/shard-{index:04d}.{digest[:10]}.json"
+        file_path = os.path.join(SHARD_DIR, os.path.basename(path))
+        if not cached or cached['digest'] != digest or not os.path.exists(file_path):
+            # シャード内も新しい順に並べて保存する
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump({'cards': [card['html'] for card in reversed(shard)]}, f, ensure_ascii=False)
+            written += 1
+        fresh[str(index)] = {'digest': digest, 'path': path}
+        paths.append(path)
+    cache['shards'] = fresh
+
+    # どのシャードからも参照されなくなった古いファイルを消す（圧縮ファイルは元のファイルに合わせる）
+    live = {os.path.basename(path) for path in paths}
+    for name in os.listdir(SHARD_DIR):
+        if name.startswith('shard-') and name.split('.json')[0] + '.json' not in live:
+            os.remove(os.path.join(SHARD_DIR, name))
+    return paths, written
+
+def main(processed=None):
+    if processed is None:
+        processed = get_store().with_infographic()
+
+    cache = load_card_cache()
+    cards, rendered = render_cards(processed, cache)
+    shards = [cards[i:i + SHARD_SIZE] for i in range(0, len(cards), SHARD_SIZE)]
+
+    # 最新のシャードはページに直接埋め込み、それ以前のシャードはスクロールに応じて読み込む
+    paths, written = write_shards(shards[:-1], cache)
+    newest = shards[-1] if shards else []
+
+    # 全文検索の索引は、原稿が変わった資料を含むセグメントだけを作り直す
+    search, rebuilt, search_written = search_index.update(
+        [(url, data) for url, data in processed.items() if data.get('infographic_path')])
+    manifest = {'total': len(cards), 'shards': list(reversed(paths)), 'search': search}
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    # 逆順（新しい順）に表示
+    full_html = INDEX_TEMPLATE.format(items="".join(card['html'] for card in reversed(newest)),
+                                      script=LAZY_LOAD_SCRIPT + SEARCH_SCRIPT)
 
     with open(INDEX_PATH, 'w', encoding='utf-8') as f:
         f.write(full_html)
+    save_card_cache(cache)
     
-    print(f"Index page generated at {INDEX_PATH}")
+    print(f"Index page generated at {INDEX_PATH} ({rendered} cards rendered, {written} shards written)")
+    print(f"Search index: {search['total']} documents, {rebuilt} segments rebuilt, {search_written} files written")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage('generate_index'):
+        main()
+    metrics.export('generate_index')
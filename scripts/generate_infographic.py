@@ -1,14 +1,36 @@
 import os
 import json
-import subprocess
+import time
+import argparse
+import hashlib
+import threading
 import markdown
-from openai import OpenAI
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from llm_pool import RateLimiter, chat_completion
+from state import load_processed, save_entry
+from pdf_text import TEXT_BUDGET, extract_pages, file_digest, select_text
+from mapreduce import summarize_chunks
+from blobstore import inherit_generated, output_name
+import build_css
+import metrics
+import versions
 
-client = OpenAI()
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+INFOGRAPHIC_DIR = os.path.join(REPO_DIR, 'docs/infographics')
+DRAFT_DIR = os.path.join(REPO_DIR, 'data/drafts')
 
-PROCESSED_FILE = '/home/ubuntu/manus-infographic/data/processed_files.json'
-INFOGRAPHIC_DIR = '/home/ubuntu/manus-infographic/docs/infographics'
-DRAFT_DIR = '/home/ubuntu/manus-infographic/data/drafts'
+MODEL = "gpt-4.1-mini"
+
+# 同時実行数とレート制限の既定値（リクエスト数/分, トークン数/分）
+DEFAULT_WORKERS = 4
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+# レート制限用の出力トークン見積もり
+COMPLETION_TOKENS_ESTIMATE = 3000
+# 原稿からの再レンダリングはCPUのみを使うので、コア数だけプロセスを立てる
+RENDER_WORKERS = os.cpu_count() or 1
+
+MARKDOWN_EXTENSIONS = ['extra', 'nl2br', 'sane_lists']
 
 os.makedirs(INFOGRAPHIC_DIR, exist_ok=True)
 os.makedirs(DRAFT_DIR, exist_ok=True)
@@ -20,30 +42,9 @@ HTML_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{title}</title>
-    <script src="https://cdn.tailwindcss.com"></script>
     <link href="https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;500;700;900&display=swap" rel="stylesheet">
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <style>
-        body {{ font-family: 'Noto Sans JP', sans-serif; background-color: #f1f5f9; color: #0f172a; }}
-        .hero-gradient {{ background: linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%); }}
-        .card {{ background: white; border-radius: 1.5rem; box-shadow: 0 10px 25px -5px rgba(0, 0, 0, 0.05); border: 1px solid #e2e8f0; }}
-        .accent-title {{ position: relative; display: inline-block; padding-bottom: 0.5rem; }}
-        .accent-title::after {{ content: ''; position: absolute; left: 0; bottom: 0; width: 40%; height: 4px; background: #3b82f6; border-radius: 2px; }}
-        
-        /* Markdown Custom Styling */
-        .content-area h3 {{ font-size: 1.125rem; font-weight: 700; color: #1e40af; margin-top: 1.5rem; margin-bottom: 0.75rem; }}
-        .content-area p {{ margin-bottom: 1rem; line-height: 1.7; color: #334155; }}
-        .content-area ul {{ list-style: none; padding-left: 0; margin-bottom: 1.25rem; }}
-        .content-area li {{ position: relative; padding-left: 1.5rem; margin-bottom: 0.5rem; }}
-        .content-area li::before {{ content: '•'; position: absolute; left: 0; color: #3b82f6; font-weight: bold; }}
-        
-        /* Specific Layout Components */
-        .date-box {{ background: #eff6ff; border-left: 6px solid #2563eb; padding: 1.5rem; border-radius: 0.75rem; }}
-        .expense-item {{ background: #f8fafc; border: 1px solid #e2e8f0; padding: 1rem; border-radius: 0.75rem; transition: all 0.2s; }}
-        .expense-item:hover {{ border-color: #3b82f6; background: #f0f9ff; }}
-        
-        .highlight-card {{ background: linear-gradient(to right, #ffffff, #f0f9ff); border-left: 8px solid #3b82f6; }}
-    </style>
+    <link rel="stylesheet" href="../assets/site.css">
 </head>
 <body class="py-12 px-4 md:px-6 lg:px-8">
     <div class="max-w-6xl mx-auto">
@@ -63,6 +64,7 @@ HTML_TEMPLATE = """
             </div>
             <i class="fas fa-file-invoice-dollar absolute -right-16 -bottom-16 text-[20rem] text-white/5 rotate-12"></i>
         </header>
+{changes_panel}
 
         <!-- Top Highlights: Summary & Dates -->
         <div class="grid grid-cols-1 lg:grid-cols-3 gap-8 mb-10">
@@ -171,16 +173,33 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def extract_text_from_pdf(pdf_path):
+# 旧版からの差分更新で作られた原稿にだけ表示するパネル
+CHANGES_PANEL_TEMPLATE = """
+        <!-- Changes since previous edition -->
+        <section class="card p-8 mb-10 border-l-4 border-amber-400 bg-amber-50">
+            <h2 class="text-xl font-black text-amber-800 mb-4 flex items-center gap-3">
+                <i class="fas fa-clock-rotate-left"></i> 前版からの変更点
+            </h2>
+            <div class="content-area text-slate-700">
+                {changes}
+            </div>
+            <p class="text-xs text-slate-600 mt-3">前版: <a href="{previous_href}" class="underline">{previous_title}</a></p>
+        </section>
+"""
+
+def load_pages(pdf_path, digest=None):
     try:
-        result = subprocess.run(['pdftotext', '-l', '25', pdf_path, '-'], capture_output=True, text=True)
-        return result.stdout[:18000]
+        return extract_pages(pdf_path, digest)
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
-        return ""
+        return []
 
-def generate_markdown_draft(title, pdf_text):
-    prompt = f"""
+def extract_text_from_pdf(pdf_path, digest=None):
+    return select_text(load_pages(pdf_path, digest))
+
+SYSTEM_PROMPT = "You are a visual communication expert. Output high-quality structured content in JSON format."
+
+PROMPT_TEMPLATE = """
     あなたは超一流のビジネスアナリストです。以下の資料を読み解き、経営者が一目で内容を把握できる「視覚的構造化」された原稿を作成してください。
     
     タイトル: {title}
@@ -206,65 +225,381 @@ def generate_markdown_draft(title, pdf_text):
     
     ※注意: 各値の中身はMarkdownまたは指定されたHTML形式にしてください。
     """
+
+def draft_messages(title, pdf_text):
+    prompt = PROMPT_TEMPLATE.format(title=title, pdf_text=pdf_text)
+    return [{"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}]
+
+def parse_draft(content):
+    # キーが欠けた原稿はレンダリング時の KeyError ではなく、ここで原稿ごとのエラーにする
+    draft = json.loads(content)
+    missing = [key for key in DRAFT_KEYS if key not in draft]
+    if missing:
+        raise ValueError(f"Draft is missing keys: {', '.join(missing)}")
+    return draft
+
+def generate_markdown_draft(title, pdf_text, limiter=None):
+    content = chat_completion(
+        MODEL,
+        draft_messages(title, pdf_text),
+        limiter=limiter,
+        json_mode=True,
+        completion_estimate=COMPLETION_TOKENS_ESTIMATE,
+        document=title
+    )
+    return parse_draft(content)
+
+# 原稿JSONのキー（差分更新で置き換えてよい項目）
+DRAFT_KEYS = ['summary_short', 'summary_long', 'timeline', 'period', 'eligibility',
+              'expenses', 'detailed_sections', 'warnings', 'actions']
+
+UPDATE_PROMPT_TEMPLATE = """
+    以下は補助金・公募資料の旧版から作成した原稿（JSON）と、新版で変更された箇所の差分です。
+    差分（- は旧版で削除、+ は新版で追加された行）を読み、原稿のうち内容が変わる項目だけを更新してください。
     
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "system", "content": "You are a visual communication expert. Output high-quality structured content in JSON format."},
-                  {"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+    タイトル: {title}
+    旧版の原稿:
+    {previous_draft}
+    
+    新版での変更箇所:
+    {diff}
+    
+    【出力形式】
+    JSON形式で以下のキーを含めてください:
+    - changes: 前版からの主な変更点（Markdownの箇条書き、読み手に影響のある変更を優先）
+    - updates: 更新が必要な項目だけを含むオブジェクト。キーは旧版の原稿と同じ（{keys}）で、値は更新後の全文。
+      変更のない項目は含めないでください。
+    
+    ※注意: 各値の形式（MarkdownまたはHTML）は旧版の原稿に合わせてください。
+    """
+
+NO_CHANGES_NOTE = "- 本文に実質的な変更はありません（版数・日付などの表記のみの更新）"
+
+def update_markdown_draft(title, previous_draft, diff, limiter=None):
+    # 旧版の原稿に、変更箇所から作った更新分だけを上書きする
+    base = {key: value for key, value in previous_draft.items() if key in DRAFT_KEYS}
+    prompt = UPDATE_PROMPT_TEMPLATE.format(
+        title=title,
+        previous_draft=json.dumps(base, ensure_ascii=False, indent=1),
+        diff=diff,
+        keys=", ".join(DRAFT_KEYS)
     )
-    return json.loads(response.choices[0].message.content)
+    content = chat_completion(
+        MODEL,
+        [{"role": "system", "content": SYSTEM_PROMPT},
+         {"role": "user", "content": prompt}],
+        limiter=limiter,
+        json_mode=True,
+        completion_estimate=COMPLETION_TOKENS_ESTIMATE // 2,
+        document=title
+    )
+    result = json.loads(content)
+    updates = result.get('updates') or {}
+    base.update({key: value for key, value in updates.items() if key in DRAFT_KEYS})
+    base['changes'] = result.get('changes') or NO_CHANGES_NOTE
+    return base
+
+_converter = threading.local()
 
 def md_to_html(text):
     if not text:
         return ""
-    return markdown.markdown(text, extensions=['extra', 'nl2br', 'sane_lists'])
+    # 拡張の読み込みは重いので、スレッド（プロセス）ごとに1つの変換器を作り、reset して使い回す
+    md = getattr(_converter, 'md', None)
+    if md is None:
+        md = _converter.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md.reset().convert(text)
 
-def main():
-    if not os.path.exists(PROCESSED_FILE):
-        return
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
-    with open(PROCESSED_FILE, 'r', encoding='utf-8') as f:
-        processed = json.load(f)
+# プロンプトを変更した場合も再生成の対象になるよう、テンプレート自体のハッシュを記録する
+PROMPT_DIGEST = text_digest(SYSTEM_PROMPT + PROMPT_TEMPLATE)
 
-    for url, data in processed.items():
-        print(f"Agent is visually structuring {data['text']}...")
-        
-        pdf_text = extract_text_from_pdf(data['local_path'])
-        draft = generate_markdown_draft(data['text'], pdf_text)
-        
-        # 原稿を保存
-        pdf_filename = os.path.basename(data['local_path'])
-        draft_path = os.path.join(DRAFT_DIR, pdf_filename.replace('.pdf', '.json'))
-        with open(draft_path, 'w', encoding='utf-8') as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
-            
-        # HTMLに変換して流し込み
-        html_filename = pdf_filename.replace('.pdf', '.html')
-        html_path = os.path.join(INFOGRAPHIC_DIR, html_filename)
-        
-        html_content = HTML_TEMPLATE.format(
-            title=data['text'],
-            summary_short=draft['summary_short'],
-            summary_long=md_to_html(draft['summary_long']),
-            timeline=md_to_html(draft['timeline']),
-            period=md_to_html(draft['period']),
-            eligibility=md_to_html(draft['eligibility']),
-            expenses=draft['expenses'], # これは既にHTML形式で出力させる
-            detailed_sections=md_to_html(draft['detailed_sections']),
-            warnings=md_to_html(draft['warnings']),
-            actions=md_to_html(draft['actions']),
-            original_url=url
+def output_paths(data):
+    # PDFの保存名ではなくエントリに記録した名前から決める（PDFが更新されても公開URLは変わらない）
+    name = output_name(data)
+    html_filename = f"{name}.html"
+    return os.path.join(DRAFT_DIR, f"{name}.json"), os.path.join(INFOGRAPHIC_DIR, html_filename), html_filename
+
+def is_up_to_date(data, fingerprint, keys):
+    if not data.get('processed'):
+        return False
+    previous = data.get('fingerprint')
+    if not previous:
+        return False
+    if any(previous.get(key) != fingerprint.get(key) for key in keys):
+        return False
+    draft_path, html_path, _ = output_paths(data)
+    return os.path.exists(draft_path) and os.path.exists(html_path)
+
+def render_infographic(url, data, draft):
+    _, html_path, html_filename = output_paths(data)
+    started = time.monotonic()
+    
+    changes_panel = ""
+    if draft.get('changes'):
+        previous = draft.get('previous_edition') or {}
+        changes_panel = CHANGES_PANEL_TEMPLATE.format(
+            changes=md_to_html(draft['changes']),
+            # 旧版のページは同じ infographics/ にある
+            previous_href=os.path.basename(previous.get('infographic_path') or '') or previous.get('url', ''),
+            previous_title=previous.get('title', '')
         )
+    
+    html_content = HTML_TEMPLATE.format(
+        title=data['text'],
+        changes_panel=changes_panel,
+        summary_short=draft['summary_short'],
+        summary_long=md_to_html(draft['summary_long']),
+        timeline=md_to_html(draft['timeline']),
+        period=md_to_html(draft['period']),
+        eligibility=md_to_html(draft['eligibility']),
+        expenses=draft['expenses'], # これは既にHTML形式で出力させる
+        detailed_sections=md_to_html(draft['detailed_sections']),
+        warnings=md_to_html(draft['warnings']),
+        actions=md_to_html(draft['actions']),
+        original_url=url
+    )
+    
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    metrics.observe('render', time.monotonic() - started)
+    
+    return f"infographics/{html_filename}"
+
+def inspect_entry(data, forced, map_reduce=False):
+    if not os.path.exists(data['local_path']):
+        return {'status': 'missing'}
+
+    pdf_digest = file_digest(data['local_path'])
+    fingerprint = {'pdf': pdf_digest, 'prompt': PROMPT_DIGEST, 'model': MODEL}
+    draft_path, _, _ = output_paths(data)
+    
+    # フィンガープリント導入前に生成済みの原稿は、現在のプロンプトで作られたものとして取り込む
+    if not forced and data.get('processed') and 'fingerprint' not in data and os.path.exists(draft_path):
+        fingerprint['text'] = text_digest(extract_text_from_pdf(data['local_path'], pdf_digest))
+        return {'status': 'adopted', 'fingerprint': fingerprint}
+    
+    # PDFが変わっていなければテキスト抽出も含めてスキップ
+    if not forced and is_up_to_date(data, fingerprint, ('pdf', 'prompt', 'model')):
+        return {'status': 'unchanged'}
+    
+    pages = load_pages(data['local_path'], pdf_digest)
+    # map-reduce モードでは予算を超える資料の全文を使う
+    use_map_reduce = map_reduce and sum(len(page) for page in pages) > TEXT_BUDGET
+    pdf_text = "\n".join(pages) if use_map_reduce else select_text(pages)
+    fingerprint['text'] = text_digest(pdf_text)
+    
+    # PDFのバイト列が変わっても抽出テキストが同じならLLMは呼ばない
+    if not forced and is_up_to_date(data, fingerprint, ('text', 'prompt', 'model')):
+        return {'status': 'text_unchanged', 'fingerprint': fingerprint}
+    
+    return {'status': 'pending', 'fingerprint': fingerprint, 'pdf_text': pdf_text,
+            'pages': pages, 'map_reduce': use_map_reduce}
+
+def has_draft(data):
+    return bool(data.get('local_path')) and os.path.exists(output_paths(data)[0])
+
+def incremental_draft(data, result, processed, limiter):
+    # 旧版（第N版）の原稿があれば、ページ差分の箇所だけを要約し直して原稿を作る。使えなければ None
+    found = versions.find_previous(processed, data.get('url', ''), data, has_draft)
+    if not found:
+        return None
+    previous_url, previous = found
+    previous_pages = load_pages(previous['local_path'])
+    if not previous_pages or not versions.is_same_document(previous_pages, result['pages']):
+        return None
+    hunks = versions.page_diff(previous_pages, result['pages'])
+    if versions.changed_ratio(hunks, result['pages']) > versions.MAX_CHANGED_RATIO:
+        print(f"Too many pages changed since {previous['text']}, drafting from scratch")
+        return None
+
+    with open(output_paths(previous)[0], 'r', encoding='utf-8') as f:
+        previous_draft = json.load(f)
+    diff = versions.diff_text(previous_pages, result['pages'], hunks)
+    if len(diff) > versions.DIFF_BUDGET:
+        print(f"Diff since {previous['text']} is {len(diff)} chars (budget {versions.DIFF_BUDGET}), "
+              f"drafting from scratch")
+        metrics.incr('incremental_fallbacks', reason='diff_budget')
+        return None
+    if diff:
+        print(f"Updating draft of {previous['text']} with {len(hunks)} changed sections...")
+        draft = update_markdown_draft(data['text'], previous_draft, diff, limiter)
+    else:
+        # 版数などの表記以外に違いがなければLLMは呼ばない
+        print(f"No content changes since {previous['text']}, reusing its draft")
+        draft = {key: value for key, value in previous_draft.items() if key in DRAFT_KEYS}
+        draft['changes'] = NO_CHANGES_NOTE
+    draft['previous_edition'] = {'title': previous['text'], 'url': previous.get('url', previous_url),
+                                 'infographic_path': previous.get('infographic_path')}
+    metrics.incr('incremental_drafts', llm='yes' if diff else 'no')
+    return draft
+
+def draft_entry(data, result, limiter, processed=None):
+    print(f"Agent is visually structuring {data['text']}...")
+    draft = incremental_draft(data, result, processed, limiter) if processed else None
+    if draft is not None:
+        result['fingerprint']['mode'] = 'incremental'
+    elif result.get('map_reduce'):
+        # 各チャンクを並列に部分要約し、その要約から通常の形式の原稿を組み立てる
+        summaries = summarize_chunks(result['pages'], limiter, document=data['text'])
+        draft = generate_markdown_draft(data['text'], summaries, limiter)
+        result['fingerprint']['mode'] = 'map_reduce'
+    else:
+        draft = generate_markdown_draft(data['text'], result['pdf_text'], limiter)
+    return {'status': 'drafted', 'fingerprint': result['fingerprint'], 'draft': draft}
+
+def prepare_entry(url, data, forced, limiter, map_reduce=False, processed=None):
+    result = inspect_entry(data, forced, map_reduce)
+    if result['status'] == 'pending':
+        # 強制再生成のときは旧版からの差分更新を使わない
+        result = draft_entry(data, result, limiter, None if forced else processed)
+    return result
+
+def apply_result(url, data, result):
+    status = result['status']
+    if status == 'missing':
+        print(f"PDF not found, skipping {data['text']}: {data['local_path']}")
+        return False
+    if status == 'unchanged':
+        print(f"Unchanged, skipping {data['text']}")
+        return False
+    # 出力名をエントリに記録し、以後PDFが差し替わっても同じ名前で出力する
+    data.setdefault('output_name', output_name(data))
+    if status in ('adopted', 'text_unchanged'):
+        data['fingerprint'] = result['fingerprint']
+        save_entry(url, data)
+        print(f"{'Adopted existing draft' if status == 'adopted' else 'Text unchanged, skipping'} {data['text']}")
+        return False
+    
+    draft = result['draft']
+    draft_path, _, _ = output_paths(data)
+    
+    # 原稿を保存
+    with open(draft_path, 'w', encoding='utf-8') as f:
+        json.dump(draft, f, ensure_ascii=False, indent=2)
         
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        data['processed'] = True
-        data['infographic_path'] = f"infographics/{html_filename}"
+    # HTMLに変換して流し込み
+    data['infographic_path'] = render_infographic(url, data, draft)
+    data['processed'] = True
+    data['fingerprint'] = result['fingerprint']
+    save_entry(url, data)
+    return True
+
+def copy_from_twins(processed, urls):
+    for url in urls:
+        if inherit_generated(processed, url) is not None:
+            save_entry(url, processed[url])
+
+def needs_check(data):
+    # PDFを読まずに判定できる範囲で、再生成が必要になり得るエントリかを調べる
+    fingerprint = data.get('fingerprint')
+    if not data.get('processed') or not fingerprint:
+        return True
+    if fingerprint.get('prompt') != PROMPT_DIGEST or fingerprint.get('model') != MODEL:
+        return True
+    draft_path, html_path, _ = output_paths(data)
+    return not (os.path.exists(draft_path) and os.path.exists(html_path))
+
+def main(force=False, only=None, workers=DEFAULT_WORKERS, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM,
+         map_reduce=False, processed=None, changed=None, targets=None):
+    if processed is None:
+        processed = load_processed()
+
+    # changed が渡された場合（パイプライン実行時）は、それ以外の最新エントリのPDF読み込みを省く
+    # targets を渡すと、そのエントリだけを対象にする（only と違い強制再生成はしない。スケジューラーの再試行用）
+    targets = [(url, data) for url, data in processed.items()
+               if (not only or url in only)
+               and (targets is None or url in targets)
+               and (changed is None or url in changed or needs_check(data))]
+    # 同じ内容のPDF（別URL）は最初の1件だけ生成し、残りは結果を引き継ぐ
+    primaries, duplicates, seen_paths = [], [], set()
+    for url, data in targets:
+        if data['local_path'] in seen_paths:
+            duplicates.append(url)
+        else:
+            seen_paths.add(data['local_path'])
+            primaries.append((url, data))
+    forced = force or bool(only)
+    limiter = RateLimiter(rpm, tpm)
+    generated = []
+
+    # 抽出とLLM呼び出しは並列に行い、書き込みは元の順序でメインスレッドから行う
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [(url, data, executor.submit(prepare_entry, url, data, forced, limiter, map_reduce, processed))
+                   for url, data in primaries]
+        for url, data, future in futures:
+            try:
+                if apply_result(url, data, future.result()):
+                    generated.append(url)
+            except Exception as e:
+                print(f"Error generating infographic for {data['text']}: {e}")
+
+    copy_from_twins(processed, duplicates)
+    return generated
+
+def render_from_draft(url, data):
+    # ワーカープロセス内で記録したメトリクスは親に届かないので、描画時間は戻り値で返して親で記録する
+    draft_path, _, _ = output_paths(data)
+    with open(draft_path, 'r', encoding='utf-8') as f:
+        draft = json.load(f)
+    started = time.monotonic()
+    path = render_infographic(url, data, draft)
+    return path, time.monotonic() - started
+
+def render_all(processed=None, workers=RENDER_WORKERS):
+    # 保存済みの原稿だけからHTMLを作り直す（テンプレート変更時用。APIは呼ばない）
+    if processed is None:
+        processed = load_processed()
+
+    targets, seen_paths = [], set()
+    for url, data in processed.items():
+        if not data.get('processed') or data['local_path'] in seen_paths:
+            continue
+        if not os.path.exists(output_paths(data)[0]):
+            continue
+        seen_paths.add(data['local_path'])
+        targets.append((url, data))
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [(url, data, executor.submit(render_from_draft, url, data)) for url, data in targets]
+        for url, data, future in futures:
+            try:
+                _, seconds = future.result()
+                metrics.observe('render', seconds)
+                rendered += 1
+            except Exception as e:
+                print(f"Error rendering infographic for {data['text']}: {e}")
+
+    print(f"Rendered {rendered} infographics from drafts")
+    build_css.main()
+    return rendered
 
-    with open(PROCESSED_FILE, 'w', encoding='utf-8') as f:
-        json.dump(processed, f, ensure_ascii=False, indent=2)
+def parse_args():
+    parser = argparse.ArgumentParser(description='PDFからインフォグラフィックを生成する')
+    parser.add_argument('--force', action='store_true', help='変更の有無にかかわらず全件を再生成する')
+    parser.add_argument('--only', action='append', metavar='URL', help='指定したURLのみを再生成する（複数指定可）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='同時に処理する資料数')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_RPM, help='1分あたりの最大リクエスト数（0で無制限）')
+    parser.add_argument('--tpm', type=int, default=DEFAULT_TPM, help='1分あたりの最大トークン数（0で無制限）')
+    parser.add_argument('--map-reduce', action='store_true',
+                        help='長い資料は全文をチャンクに分けて部分要約してから統合する')
+    subparsers = parser.add_subparsers(dest='command')
+    render = subparsers.add_parser('render', help='保存済みの原稿からHTMLだけを作り直す（APIは呼ばない）')
+    render.add_argument('--workers', dest='render_workers', type=int, default=RENDER_WORKERS,
+                        help='レンダリングに使うプロセス数')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.command == 'render':
+        with metrics.stage('render'):
+            render_all(workers=args.render_workers)
+    else:
+        with metrics.stage('generate_infographic'):
+            main(force=args.force, only=args.only, workers=args.workers, rpm=args.rpm, tpm=args.tpm,
+                 map_reduce=args.map_reduce)
+    metrics.export('generate_infographic')
@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+from crawler import host_of
+
+# selectolax がある環境では C 実装のパーサーでリンクを抜き出す
+try:
+    from selectolax.parser import HTMLParser as FastParser
+except ImportError:
+    FastParser = None
+
+# <meta charset> はほぼ先頭にあるため、この範囲だけを調べる
+META_SNIFF_BYTES = 4096
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+
+# サイトごとの抽出ルール。host はサフィックス一致で、最初に一致したものを使う
+#   include / exclude: 絶対URLに対する正規表現（include は全部、exclude は1つでも一致で除外）
+#   text_cleanup: リンク文字列に順に適用する (パターン, 置換) の組
+SITE_RULES = [
+    {
+        # IT導入補助金の場合は公募要領のみに絞る
+        'host': 'it-shien.smrj.go.jp',
+        'include': [r'koubo'],
+    },
+]
+DEFAULT_RULE = {'host': '', 'include': [], 'exclude': [], 'text_cleanup': []}
+PDF_LINK = re.compile(r'\.pdf$', re.I)
+PDF_MENTION = re.compile(r'\.pdf', re.I)
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+_compiled = {}
+
+def rule_for(url):
+    host = host_of(url)
+    for rule in SITE_RULES:
+        if host == rule['host'] or host.endswith('.' + rule['host']):
+            return rule
+    return DEFAULT_RULE
+
+def compiled(rule):
+    # ルールの正規表現は一度だけコンパイルする
+    key = id(rule)
+    if key not in _compiled:
+        _compiled[key] = (
+            [re.compile(p) for p in rule.get('include', [])],
+            [re.compile(p) for p in rule.get('exclude', [])],
+            [(re.compile(p), r) for p, r in rule.get('text_cleanup', [])],
+        )
+    return _compiled[key]
+
+class AnchorParser(HTMLParser):
+    # ツリーは作らず、<a href> とその中の文字列だけを集める
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors = []
+        self.href = None
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        if self.href is not None:
+            # 閉じタグのない <a> は次の <a> で閉じる（html.parser と同じ扱い）
+            self._close()
+        href = dict(attrs).get('href')
+        if href is not None:
+            self.href = href
+            self.text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.href is not None:
+            self._close()
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.text.append(data)
+
+    def _close(self):
+        # BeautifulSoup の get_text(strip=True) と同じく、各文字列を strip して連結する
+        self.anchors.append((self.href, ''.join(piece.strip() for piece in self.text)))
+        self.href = None
+        self.text = []
+
+    def close(self):
+        super().close()
+        if self.href is not None:
+            self._close()
+
+def iter_anchors(html):
+    if FastParser is not None:
+        for node in FastParser(html).css('a[href]'):
+            yield node.attributes.get('href') or '', node.text(deep=True, separator='', strip=True)
+        return
+    parser = AnchorParser()
+    parser.feed(html)
+    parser.close()
+    yield from parser.anchors
+
+def sniff_meta_charset(content):
+    match = META_CHARSET.search(content[:META_SNIFF_BYTES])
+    return match.group(1).decode('ascii').lower() if match else None
+
+def detect_encoding(response, hint=None):
+    # ヘッダーに charset があればそれを使う。なければ meta、前回の結果、ホストごとの結果の順に使い、
+    # 最後の手段としてのみ本文全体の文字コード推定（chardet）を行う
+    if response.encoding and response.encoding != 'ISO-8859-1':
+        return response.encoding
+    host = host_of(response.url)
+    encoding = sniff_meta_charset(response.content) or hint
+    if not encoding:
+        with _encodings_lock:
+            encoding = _encodings.get(host)
+    if not encoding:
+        encoding = response.apparent_encoding
+    with _encodings_lock:
+        _encodings[host] = encoding
+    return encoding
+
+def extract_pdf_links(html, base_url):
+    # 一覧ページのPDFリンクを、サイトごとのルールを適用して返す
+    # PDFへの言及がないページは解析しない
+    if not PDF_MENTION.search(html):
+        return []
+    links = []
+    for href, text in iter_anchors(html):
+        clean_href = href.split('?')[0]
+        if not PDF_LINK.search(clean_href):
+            continue
+        full_url = urljoin(base_url, href)
+        include, exclude, cleanup = compiled(rule_for(full_url))
+        if not all(pattern.search(full_url) for pattern in include):
+            continue
+        if any(pattern.search(full_url) for pattern in exclude):
+            continue
+        for pattern, replacement in cleanup:
+            text = pattern.sub(replacement, text).strip()
+        text = text or os.path.basename(urlparse(full_url).path)
+        links.append({'url': full_url, 'text': text})
+    return links
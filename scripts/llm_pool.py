@@ -0,0 +1,107 @@
+import time
+import random
+import threading
+import openai
+from openai import OpenAI
+import metrics
+
+# 再試行は call_with_retry 側でジッター付きバックオフとして行う
+client = OpenAI(max_retries=0)
+
+# 408（タイムアウト）・409（競合）・429・5xx、および通信エラーのみ再試行する（OpenAI SDK の既定と同じ）
+RETRYABLE_STATUS = {408, 409, 429}
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, delta):
+        # 見積もりと実績の差分を精算する（負の残高も許し、次の取得を遅らせる）
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, estimated_tokens):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    def record(self, estimated_tokens, actual_tokens):
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+def call_with_retry(fn, max_retries=5, base_delay=1.0, max_delay=60.0):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            # Full jitter: 0〜上限の一様乱数。サーバーが Retry-After を返した場合はそれ以上待つ
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            delay = max(delay, retry_after(e) or 0)
+            metrics.incr('llm_retries', error=e.__class__.__name__)
+            print(f"Retrying after {delay:.1f}s ({e.__class__.__name__}, attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+def chat_completion(model, messages, limiter=None, json_mode=False, completion_estimate=1000, document=None):
+    # 日本語はおおむね1文字1トークン程度として見積もる
+    estimated_tokens = sum(len(message['content']) for message in messages) + completion_estimate
+    kwargs = {'response_format': {"type": "json_object"}} if json_mode else {}
+    started = [None]
+
+    def request():
+        if limiter:
+            limiter.acquire(estimated_tokens)
+        # レート制限の待ち時間は含めず、成功した試行のモデル応答時間だけを計る
+        started[0] = time.monotonic()
+        return client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+    response = call_with_retry(request)
+    # document を渡すと、資料ごとのトークン数と料金が集計される
+    metrics.record_llm(model, response.usage, time.monotonic() - started[0], document)
+    if limiter and response.usage:
+        limiter.record(estimated_tokens, response.usage.total_tokens)
+    return response.choices[0].message.content
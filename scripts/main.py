@@ -1,42 +1,141 @@
 import subprocess
 import os
+import sys
+import time
+import traceback
+import argparse
 
-SCRIPTS_DIR = '/home/ubuntu/manus-infographic/scripts'
-REPO_DIR = '/home/ubuntu/manus-infographic'
+# このファイルと同じディレクトリのスクリプトを使う（データの場所は各モジュールが MANUS_REPO_DIR から決める）
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, SCRIPTS_DIR)
+
+import metrics
+import publish
 
 def run_script(name):
     print(f"--- Running {name} ---")
     script_path = os.path.join(SCRIPTS_DIR, name)
-    result = subprocess.run(['python3', script_path], capture_output=True, text=True)
+    started = time.monotonic()
+    # 子プロセスは自分のメトリクスを <script>-latest.json / manus_<script>.prom に書き出す
+    with metrics.stage(name.replace('.py', '')):
+        result = subprocess.run(['python3', script_path], capture_output=True, text=True)
     print(result.stdout)
     if result.stderr:
         print(f"Error in {name}: {result.stderr}")
+    print(f"--- {name} finished in {time.monotonic() - started:.1f}s ---")
 
-def main():
+def run_stage(name, fn, *args, default=None, **kwargs):
+    # サブプロセス実行時と同様、ステージが失敗しても後続のステージは実行する
+    print(f"--- Running {name} ---", flush=True)
+    started = time.monotonic()
+    try:
+        with metrics.stage(name):
+            return fn(*args, **kwargs)
+    except Exception:
+        metrics.incr('stage_errors', stage=name)
+        print(f"Error in {name}: {traceback.format_exc()}")
+        return default
+    finally:
+        print(f"--- {name} finished in {time.monotonic() - started:.1f}s ---", flush=True)
+
+def run_subprocess_pipeline():
     # 1. PDFチェックとダウンロード
     run_script('check_pdfs.py')
-    
+
     # 2. インフォグラフィック生成
     run_script('generate_infographic.py')
-    
+
     # 3. インデックスページ更新
     run_script('generate_index.py')
-    
-    # 4. GitHubにプッシュ
-    print("--- Pushing to GitHub ---")
+
+    # 4. 使用クラスだけのCSSを生成し、各ページのリンクを更新
+    run_script('build_css.py')
+
+    # 変更された資料の一覧は子プロセスから受け取れないので、公開は docs/ 全体を対象にする
+    return None, None, []
+
+def run_inprocess_pipeline():
+    # 各ステージを関数として呼び出し、状態とHTTPプール・OpenAIクライアントを共有する
+    import check_pdfs
+    import generate_infographic
+    import generate_index
+    import build_css
+    from state import load_processed
+
+    processed = load_processed()
+    pool = check_pdfs.create_pool()
     try:
-        os.chdir(REPO_DIR)
-        subprocess.run(['git', 'add', '.'], check=True)
-        # 変更があるか確認
-        status = subprocess.run(['git', 'status', '--porcelain'], capture_output=True, text=True)
-        if status.stdout:
-            subprocess.run(['git', 'commit', '-m', 'Update infographics and index'], check=True)
-            subprocess.run(['git', 'push', 'origin', 'main'], check=True)
-            print("Successfully pushed to GitHub.")
-        else:
-            print("No changes to commit.")
-    except Exception as e:
-        print(f"GitHub push failed: {e}")
+        # 1. PDFチェックとダウンロード
+        new_pdfs = run_stage('check_pdfs', check_pdfs.main, processed=processed, pool=pool, default=[])
+    finally:
+        pool.close()
+
+    # 2. インフォグラフィック生成（新規・更新分と、再生成が必要なものだけを対象にする）
+    changed = set(new_pdfs)
+    generated = run_stage('generate_infographic', generate_infographic.main,
+                          processed=processed, changed=changed, default=[])
+
+    # 3. インデックスページ更新
+    run_stage('generate_index', generate_index.main, processed=processed)
+
+    # 4. 使用クラスだけのCSSを生成し、各ページのリンクを更新
+    built = run_stage('build_css', build_css.main, default=[])
+    print(f"New or updated PDFs: {len(changed)}, infographics generated: {len(generated)}")
+    return processed, changed | set(generated), built
+
+def run_streaming_pipeline():
+    # クロールから公開までを有界キューでつなぎ、資料ごとに準備ができ次第流す
+    import check_pdfs
+    import pipeline
+    import build_css
+    from state import load_processed
+
+    processed = load_processed()
+    pool = check_pdfs.create_pool()
+    try:
+        generated = run_stage('streaming pipeline', pipeline.main, processed, pool, default=[])
+    finally:
+        pool.close()
+    # 公開済みのページはハッシュなしの site.css を参照しているので、最後に一度だけ付け替える
+    built = run_stage('build_css', build_css.main, default=[])
+    return processed, set(generated), built
+
+def main(use_subprocess=False, stream=False, profile=None, daemon=False):
+    started = time.monotonic()
+    if profile:
+        # サブプロセス実行時にも効くよう、環境変数でも子に伝える
+        metrics.PROFILE_STAGES.update(profile)
+        os.environ['MANUS_PROFILE'] = ','.join(sorted(metrics.PROFILE_STAGES))
+    if daemon:
+        # 常駐し、一覧ページごとに学習した間隔で巡回する（停止するまで戻らない）
+        import scheduler
+        scheduler.run()
+        return
+    if use_subprocess:
+        processed, changed, built = run_subprocess_pipeline()
+    elif stream:
+        processed, changed, built = run_streaming_pipeline()
+    else:
+        processed, changed, built = run_inprocess_pipeline()
+
+    # 5. 今回変わった公開ファイルだけをコミットし、変更がなければ push もしない
+    run_stage('publish', publish.main, processed=processed, urls=changed, extra_paths=built)
+    print(f"Pipeline finished in {time.monotonic() - started:.1f}s")
+    metrics.export('pipeline')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='PDF取得からインフォグラフィック公開までを実行する')
+    parser.add_argument('--subprocess', dest='use_subprocess', action='store_true',
+                        help='各ステージを従来どおり別プロセスで実行する')
+    parser.add_argument('--stream', action='store_true',
+                        help='ステージ間をキューでつなぎ、資料ごとに逐次処理する')
+    parser.add_argument('--daemon', action='store_true',
+                        help='常駐して一覧ページごとに巡回間隔を調整しながら実行する（scheduler.py）')
+    parser.add_argument('--profile', action='append', metavar='STAGE',
+                        help='指定したステージの cProfile を data/metrics に保存する（all で全ステージ、複数指定可）')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(use_subprocess=args.use_subprocess, stream=args.stream, profile=args.profile, daemon=args.daemon)
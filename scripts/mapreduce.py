@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from llm_pool import chat_completion
+import metrics
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+CHUNK_CACHE_DIR = os.path.join(REPO_DIR, 'data/chunk_cache')
+
+os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+
+# 部分要約には安価なモデルを使い、統合（reduce）は通常の原稿生成で行う
+MAP_MODEL = "gpt-4.1-nano"
+# 1チャンクあたりの最大文字数（ページ境界で区切る）
+CHUNK_SIZE = 6000
+# 内容のハッシュがこの数で割り切れるページの後で区切る（平均でこのページ数ごとのチャンクになる）
+CUT_PAGES = 3
+MAP_WORKERS = 4
+MAP_COMPLETION_TOKENS_ESTIMATE = 800
+
+MAP_SYSTEM_PROMPT = "You extract key facts from Japanese public subsidy documents. Be concise and never invent facts."
+
+MAP_PROMPT_TEMPLATE = """
+    以下は補助金・公募資料の一部です。後で全体の要約に使うため、次の観点の事実だけを漏れなく箇条書きで抜き出してください。
+    - 補助対象者・申請要件・補助率・補助上限額
+    - 補助対象経費（経費区分ごと）
+    - 公募期間・締切・事業実施期間などの日程
+    - 注意事項・不備になりやすい点
+    該当する記述がなければ「該当なし」とだけ出力してください。
+
+    資料テキスト:
+    {chunk}
+    """
+
+def is_cut_point(page):
+    # ページの内容だけで区切りを決める（前後のページの長さに左右されない）
+    digest = hashlib.sha256(page.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % CUT_PAGES == 0
+
+def chunk_pages(pages, size=CHUNK_SIZE):
+    # 改訂版でもページ単位の変更がそのチャンクだけに留まるよう、区切りはページ境界の内容で決める
+    # 文字数で詰めると1ページの増減で後ろのチャンクの境界がすべてずれ、キャッシュが効かなくなる
+    chunks = []
+    current = []
+    length = 0
+
+    def flush():
+        nonlocal current, length
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        length = 0
+
+    for page in pages:
+        if not page.strip():
+            continue
+        if len(page) > size:
+            # 長いページは単独で分割する（前後のチャンクには影響しない）
+            flush()
+            chunks.extend(page[start:start + size] for start in range(0, len(page), size))
+            continue
+        if current and length + len(page) + 1 > size:
+            # 上限で切った場合も、次の内容由来の区切りで境界がそろい直す
+            flush()
+        current.append(page)
+        length += len(page) + 1
+        if is_cut_point(page):
+            flush()
+    flush()
+    return chunks
+
+def chunk_key(chunk):
+    material = json.dumps([MAP_MODEL, MAP_SYSTEM_PROMPT, MAP_PROMPT_TEMPLATE, chunk], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def summarize_chunk(chunk, limiter=None, document=None):
+    # 同じチャンク・同じプロンプトの要約はキャッシュから返す
+    cache_path = os.path.join(CHUNK_CACHE_DIR, f"{chunk_key(chunk)}.txt")
+    if os.path.exists(cache_path):
+        metrics.incr('chunk_cache', result='hit')
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read(), True
+    metrics.incr('chunk_cache', result='miss')
+
+    summary = chat_completion(
+        MAP_MODEL,
+        [{"role": "system", "content": MAP_SYSTEM_PROMPT},
+         {"role": "user", "content": MAP_PROMPT_TEMPLATE.format(chunk=chunk)}],
+        limiter=limiter,
+        completion_estimate=MAP_COMPLETION_TOKENS_ESTIMATE,
+        document=document
+    )
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(summary)
+    os.replace(tmp_path, cache_path)
+    return summary, False
+
+def summarize_chunks(pages, limiter=None, workers=MAP_WORKERS, document=None):
+    chunks = chunk_pages(pages)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(lambda chunk: summarize_chunk(chunk, limiter, document), chunks))
+    cached = sum(1 for _, hit in results if hit)
+    print(f"Map step: {len(chunks)} chunks, {cached} from cache")
+    # 元の順序で並べ、統合プロンプトへ渡す
+    return "\n\n".join(f"[部分{i + 1}]\n{summary}" for i, (summary, _) in enumerate(results)
+                       if summary.strip() != "該当なし")
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+METRICS_DIR = os.path.join(REPO_DIR, 'data/metrics')
+# node_exporter の textfile collector に読ませる場合はそのディレクトリを指定する
+TEXTFILE_DIR = os.environ.get('MANUS_METRICS_TEXTFILE_DIR', METRICS_DIR)
+# cProfile を取るステージ名（カンマ区切り、all で全ステージ）
+PROFILE_STAGES = {name for name in os.environ.get('MANUS_PROFILE', '').split(',') if name}
+
+# 100万トークンあたりの料金（USD, 入力・出力）
+MODEL_PRICES = {
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1-nano': (0.10, 0.40),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+_documents = {}
+_started = time.time()
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def incr(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    with _lock:
+        key = _key(name, labels)
+        timer = _timers.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        ms = seconds * 1000
+        timer['count'] += 1
+        timer['total_ms'] += ms
+        timer['max_ms'] = max(timer['max_ms'], ms)
+
+@contextmanager
+def timer(name, **labels):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+def record_llm(model, usage, seconds, document=None, discount=1.0):
+    # usage は OpenAI のレスポンスの usage（欠けている場合は None）。Batch API の結果は割引率を掛ける
+    # seconds が None（Batch API など応答時間を測れない場合）はトークン数と料金だけを数える
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    cost = cost_usd(model, prompt_tokens, completion_tokens) * discount
+    if seconds is not None:
+        observe('llm_request', seconds, model=model)
+    incr('llm_prompt_tokens', prompt_tokens, model=model)
+    incr('llm_completion_tokens', completion_tokens, model=model)
+    incr('llm_cost_usd', cost, model=model)
+    if document:
+        with _lock:
+            totals = _documents.setdefault(document, {'requests': 0, 'prompt_tokens': 0,
+                                                      'completion_tokens': 0, 'cost_usd': 0.0})
+            totals['requests'] += 1
+            totals['prompt_tokens'] += prompt_tokens
+            totals['completion_tokens'] += completion_tokens
+            totals['cost_usd'] += cost
+
+@contextmanager
+def stage(name):
+    # ステージ全体の時間を計り、指定があれば cProfile の結果を保存する
+    profiler = None
+    if name in PROFILE_STAGES or 'all' in PROFILE_STAGES:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with timer('stage', stage=name):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            path = os.path.join(METRICS_DIR, f"profile-{name}.prof")
+            profiler.dump_stats(path)
+            print(f"Profile for {name} written to {path}")
+
+def snapshot():
+    with _lock:
+        return {
+            'started': _started,
+            'finished': time.time(),
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(_counters.items())],
+            'timers': [{'name': name, 'labels': dict(labels), **{k: round(v, 3) for k, v in timer.items()}}
+                       for (name, labels), timer in sorted(_timers.items())],
+            'documents': {title: dict(totals, cost_usd=round(totals['cost_usd'], 6))
+                          for title, totals in _documents.items()},
+        }
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + '}'
+
+def to_prometheus(report, job):
+    lines = []
+    typed = set()
+
+    def emit(metric, kind, labels, value):
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} {kind}")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels(dict(labels, job=job))} {value}")
+
+    for counter in report['counters']:
+        emit(f"manus_{counter['name']}_total", 'counter', counter['labels'], counter['value'])
+    for timer in report['timers']:
+        emit(f"manus_{timer['name']}_seconds_sum", 'counter', timer['labels'], timer['total_ms'] / 1000)
+        emit(f"manus_{timer['name']}_seconds_count", 'counter', timer['labels'], timer['count'])
+        emit(f"manus_{timer['name']}_seconds_max", 'gauge', timer['labels'], timer['max_ms'] / 1000)
+    emit('manus_last_run_timestamp_seconds', 'gauge', {}, round(report['finished'], 3))
+    emit('manus_last_run_duration_seconds', 'gauge', {}, round(report['finished'] - report['started'], 3))
+    return "\n".join(lines) + "\n"
+
+def write_atomic(path, content):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def export(job='pipeline'):
+    # 実行ごとのJSONレポートと、Prometheus の textfile collector 用ファイルを書き出す
+    report = snapshot()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    os.makedirs(TEXTFILE_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(report['finished']))
+    content = json.dumps(dict(report, job=job), ensure_ascii=False, indent=2)
+    write_atomic(os.path.join(METRICS_DIR, f"{job}-{stamp}.json"), content)
+    write_atomic(os.path.join(METRICS_DIR, f"{job}-latest.json"), content)
+    write_atomic(os.path.join(TEXTFILE_DIR, f"manus_{job}.prom"), to_prometheus(report, job))
+
+    total_cost = sum(c['value'] for c in report['counters'] if c['name'] == 'llm_cost_usd')
+    print(f"Metrics written to {METRICS_DIR} ({len(report['documents'])} documents, ${total_cost:.4f} LLM cost)")
+    return report
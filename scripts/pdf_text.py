@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import subprocess
+import metrics
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+TEXT_CACHE_DIR = os.path.join(REPO_DIR, 'data/text_cache')
+
+os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+
+# LLMに渡すテキストの上限（文字数）
+TEXT_BUDGET = 18000
+
+# ページの関連度を測る見出し語と重み
+KEYWORDS = {
+    '経費': 3,
+    '公募期間': 3,
+    '申請要件': 3,
+    '補助対象': 2,
+    '補助率': 2,
+    '補助上限': 2,
+    '締切': 2,
+    '申請期間': 2,
+    '受付期間': 2,
+    '対象者': 1,
+    '要件': 1,
+    '事業実施期間': 1,
+    '注意': 1,
+}
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def extract_pages(pdf_path, digest=None):
+    # ページ単位のテキストをPDFのハッシュをキーにキャッシュし、再実行時は pdftotext を呼ばない
+    digest = digest or file_digest(pdf_path)
+    cache_path = os.path.join(TEXT_CACHE_DIR, f"{digest}.json")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                pages = json.load(f)
+            metrics.incr('text_cache', result='hit')
+            return pages
+        except Exception:
+            pass
+
+    metrics.incr('text_cache', result='miss')
+    with metrics.timer('pdftotext'):
+        result = subprocess.run(['pdftotext', pdf_path, '-'], capture_output=True, text=True, check=True)
+    # pdftotext はページ区切りにフォームフィードを出力する
+    pages = result.stdout.split('\f')
+    if pages and not pages[-1].strip():
+        pages.pop()
+
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(pages, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    return pages
+
+def page_score(page):
+    length = len(page.strip())
+    if not length:
+        return 0.0
+    hits = sum(page.count(keyword) * weight for keyword, weight in KEYWORDS.items())
+    # 長いページが有利にならないよう、1000文字あたりの密度で比べる
+    return hits * 1000 / length
+
+def select_text(pages, budget=TEXT_BUDGET):
+    if sum(len(page) + 1 for page in pages) <= budget:
+        return "\n".join(pages)
+
+    # 表紙（タイトル・年度）は常に含め、残りは関連度の高い順に予算を埋める
+    ranked = sorted(range(1, len(pages)), key=lambda i: (-page_score(pages[i]), i))
+    chosen = {}
+    remaining = budget
+    for i in [0] + ranked:
+        if remaining <= 0:
+            break
+        if not pages[i].strip():
+            continue
+        chosen[i] = pages[i][:remaining]
+        remaining -= len(chosen[i]) + 1
+    # 選んだページは元の順序でつなぐ
+    return "\n".join(chosen[i] for i in sorted(chosen))
@@ -0,0 +1,206 @@
+import time
+import queue
+import threading
+import traceback
+
+import blobstore
+import metrics
+import check_pdfs
+import generate_infographic
+import generate_index
+from crawl_cache import CrawlCache
+from llm_pool import RateLimiter
+
+DONE = object()
+
+# 各ステージのワーカー数と、ステージ間キューの上限（バックプレッシャー）
+CRAWL_WORKERS = 4
+DOWNLOAD_WORKERS = 4
+EXTRACT_WORKERS = 2
+DRAFT_WORKERS = generate_infographic.DEFAULT_WORKERS
+QUEUE_SIZE = 8
+
+class Stage:
+    def __init__(self, name, fn, workers, inbox, outbox=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.remaining = workers
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def emit(self, item):
+        # 下流のキューが満杯ならここで待たされる
+        if self.outbox is not None:
+            self.outbox.put(item)
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is DONE:
+                # 兄弟ワーカーにも終了を伝え、最後のワーカーが下流へ終了を流す
+                self.inbox.put(DONE)
+                break
+            try:
+                # 下流の待ち（バックプレッシャー）も含めた1件あたりの処理時間
+                with metrics.timer('stream_item', stage=self.name):
+                    self.fn(item, self.emit)
+            except Exception:
+                metrics.incr('stream_errors', stage=self.name)
+                print(f"Error in {self.name} stage: {traceback.format_exc()}")
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last and self.outbox is not None:
+            self.outbox.put(DONE)
+
+class StreamingPipeline:
+    def __init__(self, processed, pool, revalidate=False, limiter=None):
+        self.processed = processed
+        self.pool = pool
+        self.revalidate = revalidate
+        self.limiter = limiter or RateLimiter(generate_infographic.DEFAULT_RPM, generate_infographic.DEFAULT_TPM)
+        self.cache = CrawlCache()
+        # processed への書き込みはこのロックで直列化する（永続化はエントリ単位で行われる）
+        self.state_lock = threading.Lock()
+        self.seen = set()
+        self.duplicates = []
+        self.generated = []
+        self.started = None
+        self.first_published = None
+
+    def _claim(self, url):
+        with self.state_lock:
+            if url in self.seen:
+                return False
+            self.seen.add(url)
+            return True
+
+    def crawl(self, item, emit):
+        kind, url = item
+        if kind == 'entry':
+            emit(('entry', url))
+            return
+        print(f"Checking {url}...")
+        for link in check_pdfs.get_pdf_links(url, self.pool, self.cache):
+            if not self._claim(blobstore.normalize_url(link['url'])):
+                continue
+            with self.state_lock:
+                job = check_pdfs.plan_download(self.processed, link, url, self.revalidate)
+                key = check_pdfs.find_entry(self.processed, link['url'])
+            if job:
+                emit(('job', job))
+            elif key and generate_infographic.needs_check(self.processed[key]):
+                emit(('entry', key))
+
+    def download(self, item, emit):
+        kind, payload = item
+        if kind == 'entry':
+            emit(payload)
+            return
+        local_path, changed = check_pdfs.run_download(payload, self.pool, self.cache)
+        with self.state_lock:
+            key = check_pdfs.record_download(self.processed, payload, local_path, changed)
+        if key:
+            emit(key)
+
+    def extract(self, url, emit):
+        data = self.processed[url]
+        # 同じ内容のPDFは1回だけ要約し、残りは最後に結果を引き継ぐ
+        if not self._claim(('blob', data['local_path'])):
+            with self.state_lock:
+                self.duplicates.append(url)
+            return
+        result = generate_infographic.inspect_entry(data, forced=False)
+        emit((url, result))
+
+    def draft(self, item, emit):
+        url, result = item
+        if result['status'] == 'pending':
+            result = generate_infographic.draft_entry(self.processed[url], result, self.limiter, self.processed)
+        emit((url, result))
+
+    def render(self, item, emit):
+        url, result = item
+        with self.state_lock:
+            generated = generate_infographic.apply_result(url, self.processed[url], result)
+        if generated:
+            self.generated.append(url)
+        emit(generated)
+
+    def publish(self, generated, emit):
+        # 溜まっている完了通知をまとめて処理し、インデックス更新の回数を抑える
+        changed = generated
+        while True:
+            try:
+                item = self.publish_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is DONE:
+                self.publish_queue.put(DONE)
+                break
+            changed = changed or item
+        if not changed:
+            return
+        with self.state_lock:
+            generate_index.main(processed=self.processed)
+        if self.first_published is None:
+            self.first_published = time.monotonic() - self.started
+            print(f"First infographic published after {self.first_published:.1f}s")
+
+    def run(self, urls):
+        self.started = time.monotonic()
+        # 非ストリーミング版（check_pdfs.main）と同じく、ハッシュ名導入前のファイルも重複判定に使えるようにする
+        blobstore.register_legacy(self.processed)
+        crawl_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        download_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        extract_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        draft_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        render_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.publish_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+        stages = [
+            Stage('crawl', self.crawl, CRAWL_WORKERS, crawl_queue, download_queue),
+            Stage('download', self.download, DOWNLOAD_WORKERS, download_queue, extract_queue),
+            Stage('extract', self.extract, EXTRACT_WORKERS, extract_queue, draft_queue),
+            Stage('draft', self.draft, DRAFT_WORKERS, draft_queue, render_queue),
+            Stage('render', self.render, 1, render_queue, self.publish_queue),
+            Stage('publish', self.publish, 1, self.publish_queue),
+        ]
+        for stage in stages:
+            stage.start()
+
+        for url in urls:
+            crawl_queue.put(('page', url))
+        # 一覧ページに依存しない未処理・要再生成のエントリも同じ流れに乗せる
+        for url, data in list(self.processed.items()):
+            if (generate_infographic.needs_check(data) and check_pdfs.is_valid_pdf(data['local_path'])
+                    and self._claim(blobstore.normalize_url(url))):
+                crawl_queue.put(('entry', url))
+        crawl_queue.put(DONE)
+
+        for stage in stages:
+            stage.join()
+
+        with self.state_lock:
+            generate_infographic.copy_from_twins(self.processed, self.duplicates)
+        check_pdfs.close_browser_pool()
+        check_pdfs.save_validation_cache()
+        self.cache.save()
+        print(f"Crawl cache: {self.cache.report()}")
+        print(f"Streaming pipeline finished in {time.monotonic() - self.started:.1f}s "
+              f"({len(self.generated)} infographics generated)")
+        return self.generated
+
+def main(processed, pool, revalidate=False):
+    return StreamingPipeline(processed, pool, revalidate=revalidate).run(check_pdfs.load_urls())
@@ -0,0 +1,89 @@
+import os
+import argparse
+import subprocess
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+
+# 資料ごとの出力以外で、毎回更新され得る公開ファイル（ディレクトリは削除も含めてステージされる）
+SHARED_OUTPUTS = ['docs/index.html', 'docs/index.json', 'docs/index', 'docs/search', 'docs/assets']
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+# 原稿（LLMの出力）もリポジトリに残す。PDFなどの元データは .gitignore で除外している
+PUBLISH_DRAFTS = True
+
+COMMIT_MESSAGE = 'Update infographics and index'
+# 状態の本体は SQLite（追跡しない）。新しい環境で引き継げるよう、公開のたびに JSON へ書き出してコミットする
+STATE_EXPORT = 'data/processed_files.json'
+
+def git(*args, **kwargs):
+    return subprocess.run(['git', *args], cwd=REPO_DIR, check=True, **kwargs)
+
+def with_siblings(path):
+    return [path] + [path + suffix for suffix in COMPRESSED_SUFFIXES]
+
+def changed_paths(processed, urls, extra_paths=(), drafts=PUBLISH_DRAFTS):
+    # 今回変更された資料の出力と共有ファイルだけを列挙する（リポジトリ全体は走査しない）
+    from generate_infographic import output_paths
+
+    paths = set()
+    for url in urls:
+        data = processed.get(url)
+        if not data or not data.get('local_path'):
+            continue
+        draft_path, html_path, _ = output_paths(data)
+        paths.update(with_siblings(html_path))
+        if drafts:
+            paths.add(draft_path)
+    for path in SHARED_OUTPUTS:
+        paths.update(with_siblings(os.path.join(REPO_DIR, path)))
+    paths.update(extra_paths)
+    # 存在しないパスを渡すと git add が失敗する。削除はディレクトリ指定側で拾う
+    return sorted(os.path.relpath(path, REPO_DIR) for path in paths if os.path.exists(path))
+
+def stage(paths):
+    # 1回の git add でまとめてステージする
+    pathspec = ''.join(f"{path}\0" for path in paths)
+    git('add', '--pathspec-from-file=-', '--pathspec-file-nul', input=pathspec, text=True)
+
+def has_staged_changes():
+    return subprocess.run(['git', 'diff', '--cached', '--quiet'], cwd=REPO_DIR).returncode != 0
+
+def has_unpushed_commits():
+    result = subprocess.run(['git', 'rev-list', '--count', '@{u}..HEAD'], cwd=REPO_DIR,
+                            capture_output=True, text=True)
+    return result.returncode == 0 and result.stdout.strip() not in ('', '0')
+
+def main(processed=None, urls=None, extra_paths=(), drafts=PUBLISH_DRAFTS, push=True):
+    # urls が None（サブプロセス実行時など変更一覧がない場合）は docs/ 全体を対象にする
+    from state import export_json
+
+    export_json(os.path.join(REPO_DIR, STATE_EXPORT))
+    if urls is None:
+        paths = ['docs'] + (['data/drafts'] if drafts else [])
+    else:
+        paths = changed_paths(processed or {}, urls, extra_paths, drafts)
+    paths.append(STATE_EXPORT)
+    if paths:
+        stage(paths)
+
+    if has_staged_changes():
+        git('commit', '-q', '-m', COMMIT_MESSAGE)
+        print(f"Committed changes from {len(paths)} paths")
+    elif not has_unpushed_commits():
+        # 公開内容が変わっていなければ push しない
+        print("No changes to publish.")
+        return False
+
+    if push:
+        git('push', 'origin', 'main')
+        print("Successfully pushed to GitHub.")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='生成物（docs/ と原稿、状態の JSON）だけをコミットして公開する')
+    parser.add_argument('--no-drafts', dest='drafts', action='store_false', help='原稿（data/drafts）はコミットしない')
+    parser.add_argument('--no-push', dest='push', action='store_false', help='コミットのみ行い push しない')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(drafts=args.drafts, push=args.push)
@@ -0,0 +1,317 @@
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import random
+import signal
+import argparse
+import datetime
+import threading
+import unicodedata
+import metrics
+import check_pdfs
+from crawler import host_of
+from state import load_processed, save_entry
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+SCHEDULE_FILE = os.path.join(REPO_DIR, 'data/schedule.json')
+
+# 一覧ページごとの巡回間隔（秒）。変化があれば縮め、なければ伸ばす
+INITIAL_INTERVAL = 6 * 3600
+MIN_INTERVAL = 30 * 60
+MAX_INTERVAL = 3 * 24 * 3600
+CHANGE_FACTOR = 0.5
+BACKOFF_FACTOR = 1.5
+# 同じ時刻に巡回が集中しないよう、次回時刻を ±10% ずらす
+JITTER = 0.1
+
+# 原稿の timeline にある日付の前後は、学習した間隔にかかわらずこの間隔以下で巡回する
+DEADLINE_INTERVAL = 3600
+DEADLINE_LEAD_DAYS = 7
+DEADLINE_TRAIL_DAYS = 2
+
+# 生成に失敗した資料の再試行間隔。失敗するたびに倍にし、巡回間隔の上限で頭打ちにする
+RETRY_INTERVAL = MIN_INTERVAL
+MAX_RETRY_INTERVAL = MAX_INTERVAL
+
+# urls.txt の変更や停止シグナルに気付けるよう、待機は最長でもこの秒数で区切る
+MAX_SLEEP = 300
+
+DATE = re.compile(r'(\d{4})\s*[/.\-年]\s*(\d{1,2})\s*[/.\-月]\s*(\d{1,2})')
+REIWA_DATE = re.compile(r'令和\s*(\d+|元)\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日')
+
+_draft_dates = {}
+
+def load_schedule():
+    if not os.path.exists(SCHEDULE_FILE):
+        return {}
+    try:
+        with open(SCHEDULE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable schedule {SCHEDULE_FILE}: {e}")
+        return {}
+
+def save_schedule(schedule):
+    tmp_path = SCHEDULE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(schedule, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, SCHEDULE_FILE)
+
+def new_source(now):
+    return {'interval': INITIAL_INTERVAL, 'next_due': now, 'last_checked': None, 'last_changed': None,
+            'checks': 0, 'changes': 0}
+
+def sync_sources(schedule, urls, now):
+    # urls.txt に追加されたページはすぐ巡回し、削除されたページは予定から外す
+    for url in urls:
+        if url not in schedule:
+            schedule[url] = new_source(now)
+    for url in list(schedule):
+        if url not in urls:
+            del schedule[url]
+
+def parse_dates(text):
+    # 「2025/3/25」「2025年3月25日」「令和7年3月25日」を日付にする（年のない日付は扱わない）
+    text = unicodedata.normalize('NFKC', text)
+    found = []
+    for pattern, base in ((DATE, 0), (REIWA_DATE, 2018)):
+        for year, month, day in pattern.findall(text):
+            year = 1 if year == '元' else int(year)
+            try:
+                found.append(datetime.date(base + year, int(month), int(day)))
+            except ValueError:
+                pass
+    return found
+
+def draft_dates(draft_path):
+    # 原稿ごとの日付は更新時刻が変わったときだけ読み直す
+    try:
+        mtime = os.stat(draft_path).st_mtime_ns
+    except OSError:
+        return []
+    cached = _draft_dates.get(draft_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(draft_path, 'r', encoding='utf-8') as f:
+            dates = parse_dates(json.load(f).get('timeline') or '')
+    except Exception:
+        dates = []
+    _draft_dates[draft_path] = (mtime, dates)
+    return dates
+
+def deadlines_by_source(processed, sources):
+    # 資料の取得元ページごとに、原稿の timeline の日付を集める
+    # 取得元を記録する前のエントリは、同じホストの一覧ページすべてに割り当てる
+    from generate_infographic import output_paths
+
+    by_host = {}
+    for url in sources:
+        by_host.setdefault(host_of(url), []).append(url)
+    deadlines = {}
+    seen_paths = set()
+    for url, data in list(processed.items()):
+        if not data.get('processed') or not data.get('local_path') or data['local_path'] in seen_paths:
+            continue
+        seen_paths.add(data['local_path'])
+        dates = draft_dates(output_paths(data)[0])
+        if not dates:
+            continue
+        source = data.get('source')
+        targets = [source] if source in sources else by_host.get(host_of(data.get('url') or url), [])
+        for target in targets:
+            deadlines.setdefault(target, set()).update(dates)
+    return {url: sorted(dates) for url, dates in deadlines.items()}
+
+def deadline_window(dates, now):
+    # (今が日付の前後の期間内か, 次にその期間が始まる時刻) を返す
+    today = datetime.date.fromtimestamp(now)
+    upcoming = None
+    for day in dates:
+        start = day - datetime.timedelta(days=DEADLINE_LEAD_DAYS)
+        end = day + datetime.timedelta(days=DEADLINE_TRAIL_DAYS)
+        if start <= today <= end:
+            return True, None
+        if today < start:
+            start_time = time.mktime(start.timetuple())
+            upcoming = start_time if upcoming is None else min(upcoming, start_time)
+    return False, upcoming
+
+def record_poll(state, changed, now):
+    # 新しいPDFが見つかれば間隔を縮め、見つからなければ伸ばす
+    state['checks'] += 1
+    state['last_checked'] = now
+    if changed:
+        state['changes'] += 1
+        state['last_changed'] = now
+        state['interval'] = max(MIN_INTERVAL, state['interval'] * CHANGE_FACTOR)
+    else:
+        state['interval'] = min(MAX_INTERVAL, state['interval'] * BACKOFF_FACTOR)
+
+def plan_next(state, dates, now):
+    # 締切の前後は間隔を詰め、その期間が来る前に次回が予定されていれば期間の開始時刻に前倒しする
+    interval = state['interval']
+    active, upcoming = deadline_window(dates, now)
+    if active:
+        interval = min(interval, DEADLINE_INTERVAL)
+    due = now + interval * random.uniform(1 - JITTER, 1 + JITTER)
+    if upcoming is not None and upcoming < due:
+        due = upcoming
+    state['next_due'] = due
+    state['deadline_active'] = active
+    return due
+
+def retry_due(data, now):
+    # 失敗が続く資料のために毎回の巡回で生成・公開まで走らせないよう、失敗回数に応じて間隔をあける
+    retry = data.get('retry')
+    if not retry:
+        return True
+    delay = min(MAX_RETRY_INTERVAL, RETRY_INTERVAL * 2 ** (retry['attempts'] - 1))
+    return now >= retry['last_attempt'] + delay
+
+def record_attempts(processed, urls, now):
+    # 生成を試みた資料のうち、未完了のものは失敗回数を数え、完了したものは記録を消す
+    for url in urls:
+        data = processed.get(url)
+        if data is None:
+            continue
+        if data.get('processed'):
+            if data.pop('retry', None) is not None:
+                save_entry(url, data)
+            continue
+        retry = data.setdefault('retry', {'attempts': 0})
+        retry['attempts'] += 1
+        retry['last_attempt'] = now
+        save_entry(url, data)
+
+def build_queue(schedule):
+    queue = [(state['next_due'], url) for url, state in schedule.items()]
+    heapq.heapify(queue)
+    return queue
+
+def pop_due(queue, schedule, now):
+    # 予定が変わった古い項目は取り出した時点で捨てる
+    due = []
+    while queue and queue[0][0] <= now:
+        next_due, url = heapq.heappop(queue)
+        state = schedule.get(url)
+        if state is not None and state['next_due'] == next_due:
+            due.append(url)
+    return due
+
+def run_cycle(due, processed, pool, schedule, revalidate=False, publish_changes=True):
+    # 期限の来た一覧ページだけを巡回し、新しいPDFがあればパイプラインの残りを実行する
+    import generate_infographic
+    import generate_index
+    import build_css
+    import publish
+    from main import run_stage
+
+    print(f"=== Polling {len(due)} sources ===", flush=True)
+    new_pdfs = run_stage('check_pdfs', check_pdfs.main, revalidate=revalidate, processed=processed, pool=pool,
+                         urls=due, default=None)
+    changed = set(new_pdfs or [])
+    changed_sources = {processed[key].get('source') for key in changed}
+    metrics.incr('scheduler_polls', len(due))
+    metrics.incr('scheduler_changed_sources', len(changed_sources & set(due)))
+
+    # 生成に失敗した資料も、再試行の間隔があいていれば再試行する
+    now = time.time()
+    retrying = {url for url, data in list(processed.items())
+                if not data.get('processed') and url not in changed and retry_due(data, now)}
+    if changed or retrying:
+        if retrying:
+            print(f"Retrying {len(retrying)} entries that failed to generate", flush=True)
+            metrics.incr('scheduler_retries', len(retrying))
+        # 再試行の間隔が空いていない失敗エントリは対象に入れない
+        # 生成済みでプロンプトやモデルの変更により作り直しが必要なエントリは、従来どおりこの機会に作り直す
+        attempted = changed | retrying
+        stale = {url for url, data in list(processed.items())
+                 if data.get('processed') and generate_infographic.needs_check(data)}
+        generated = run_stage('generate_infographic', generate_infographic.main,
+                              processed=processed, changed=changed, targets=attempted | stale, default=[])
+        record_attempts(processed, attempted, time.time())
+        run_stage('generate_index', generate_index.main, processed=processed)
+        built = run_stage('build_css', build_css.main, default=[])
+        if publish_changes:
+            run_stage('publish', publish.main, processed=processed, urls=changed | set(generated),
+                      extra_paths=built)
+
+    # 巡回自体が失敗した場合は学習した間隔を変えずに再試行する
+    now = time.time()
+    deadlines = deadlines_by_source(processed, set(schedule))
+    for url in due:
+        state = schedule[url]
+        if new_pdfs is not None:
+            record_poll(state, url in changed_sources, now)
+        plan_next(state, deadlines.get(url, []), now)
+    save_schedule(schedule)
+    metrics.export('scheduler')
+
+def run(once=False, revalidate=False, publish_changes=True):
+    # HTTPプール・OpenAIクライアント・状態をプロセス内に保持したまま、期限の来た一覧ページから順に巡回する
+    schedule = load_schedule()
+    processed = load_processed()
+    pool = check_pdfs.create_pool()
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        # 実行中の巡回は最後まで終えてから止まる
+        signal.signal(signum, lambda *_: stop.set())
+
+    urls_mtime = None
+    # urls.txt を読めないうちは、前回保存した予定のページを巡回する
+    queue = build_queue(schedule)
+    try:
+        while not stop.is_set():
+            try:
+                mtime = os.path.getmtime(check_pdfs.URLS_FILE)
+                if mtime != urls_mtime:
+                    sync_sources(schedule, check_pdfs.load_urls(), time.time())
+                    urls_mtime = mtime
+                    queue = build_queue(schedule)
+            except OSError as e:
+                # 編集中で一時的に消えている場合などは、前回読み込んだ一覧のまま巡回を続ける
+                print(f"Cannot read {check_pdfs.URLS_FILE}, keeping the current sources: {e}", flush=True)
+
+            due = pop_due(queue, schedule, time.time())
+            if due:
+                run_cycle(due, processed, pool, schedule, revalidate, publish_changes)
+                for url in due:
+                    heapq.heappush(queue, (schedule[url]['next_due'], url))
+            if once:
+                break
+            wait = queue[0][0] - time.time() if queue else MAX_SLEEP
+            if due and queue:
+                print(f"Next poll: {queue[0][1]} at {time.strftime('%Y-%m-%d %H:%M', time.localtime(queue[0][0]))}",
+                      flush=True)
+            stop.wait(min(MAX_SLEEP, max(0, wait)))
+    finally:
+        pool.close()
+        save_schedule(schedule)
+
+def print_status():
+    schedule = load_schedule()
+    now = time.time()
+    print(f"{'interval':>9} {'next poll':>17} {'checks':>7} {'changes':>8}  source")
+    for url, state in sorted(schedule.items(), key=lambda item: item[1]['next_due']):
+        due = 'now' if state['next_due'] <= now else time.strftime('%Y-%m-%d %H:%M', time.localtime(state['next_due']))
+        mark = ' (deadline)' if state.get('deadline_active') else ''
+        print(f"{state['interval'] / 3600:>8.1f}h {due:>17} {state['checks']:>7} {state['changes']:>8}  {url}{mark}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='一覧ページごとに巡回間隔を学習し、常駐して新しいPDFを取り込む')
+    parser.add_argument('--once', action='store_true', help='期限の来たページを1回だけ巡回して終了する（cron 用）')
+    parser.add_argument('--revalidate', action='store_true', help='ダウンロード済みのPDFも条件付きリクエストで更新を確認する')
+    parser.add_argument('--no-publish', dest='publish_changes', action='store_false', help='生成物をコミット・push しない')
+    parser.add_argument('--status', action='store_true', help='各ページの巡回間隔と次回予定を表示して終了する')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.status:
+        print_status()
+        sys.exit(0)
+    run(once=args.once, revalidate=args.revalidate, publish_changes=args.publish_changes)
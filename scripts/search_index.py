@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import html
+import hashlib
+import unicodedata
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+DOCS_DIR = os.path.join(REPO_DIR, 'docs')
+SEARCH_DIR = os.path.join(REPO_DIR, 'docs/search')
+SEARCH_CACHE_FILE = os.path.join(REPO_DIR, 'data/search_cache.json')
+
+# 索引に入れる原稿のキー（資料のタイトルは常に入れる）
+SEARCH_FIELDS = ['summary_short', 'eligibility', 'expenses', 'timeline', 'warnings']
+# 日本語は分かち書きせず、文字 n-gram（bigram）で索引する
+NGRAM = 2
+# 資料をこの件数ごとのセグメントに分け、各セグメントの転置索引を語のハッシュで BUCKETS 個のファイルに分ける
+# 資料の追加・更新・削除で書き直すのは該当セグメントのファイルだけになる
+SEGMENT_SIZE = 512
+BUCKETS = 32
+# 索引の形式やトークナイズを変えたら上げる（全セグメントを作り直し、削除で空いた枠も詰め直す）
+INDEX_VERSION = 1
+
+TAG = re.compile(r'<[^>]+>')
+# 文字と数字の連続（記号・空白・Markdown の記法で区切る）。ブラウザ側の /[\p{L}\p{N}]+/u に対応する
+WORD = re.compile(r'[^\W_]+')
+
+def normalize(text):
+    # 全角英数字や半角カナの違いをなくし、HTMLタグを除く
+    text = html.unescape(TAG.sub(' ', text))
+    return unicodedata.normalize('NFKC', text).lower()
+
+def tokenize(text, n=NGRAM):
+    grams = set()
+    for word in WORD.findall(normalize(text)):
+        if len(word) <= n:
+            grams.add(word)
+            continue
+        for i in range(len(word) - n + 1):
+            grams.add(word[i:i + n])
+    return grams
+
+def fnv1a(token):
+    # ブラウザ側と同じく、コードポイント単位の 32bit FNV-1a
+    h = 0x811c9dc5
+    for ch in token:
+        h ^= ord(ch)
+        h = (h * 0x01000193) & 0xffffffff
+    return h
+
+def bucket_of(token):
+    return fnv1a(token) % BUCKETS
+
+def doc_key(url, data, draft_path):
+    # 原稿ファイルは読まずに、更新時刻とサイズで変更を判定する
+    try:
+        stat = os.stat(draft_path)
+        draft = [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        draft = None
+    material = json.dumps([INDEX_VERSION, data['text'], data['infographic_path'], data.get('url', url), draft],
+                          ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def read_fields(data, draft_path):
+    parts = [data['text']]
+    try:
+        with open(draft_path, 'r', encoding='utf-8') as f:
+            draft = json.load(f)
+    except (OSError, ValueError):
+        return parts
+    for field in SEARCH_FIELDS:
+        value = draft.get(field)
+        if isinstance(value, str):
+            parts.append(value)
+    return parts
+
+def build_segment(docs):
+    # docs: [(url, data, draft_path)]。セグメント内の番号で転置リストを作る
+    rows = []
+    postings = {}
+    for local_id, (url, data, draft_path) in enumerate(docs):
+        rows.append([data['text'], data['infographic_path'], data.get('url', url)])
+        grams = set()
+        for text in read_fields(data, draft_path):
+            grams |= tokenize(text)
+        for gram in grams:
+            postings.setdefault(gram, []).append(local_id)
+
+    buckets = [{} for _ in range(BUCKETS)]
+    for gram, ids in postings.items():
+        # 番号は昇順なので差分で保存して小さくする
+        buckets[bucket_of(gram)][gram] = [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+    return rows, buckets
+
+def write_json(name, payload):
+    # ファイル名に内容のハッシュを入れ、同じ内容のファイルは書き直さない
+    content = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:10]
+    filename = f"{name}.{digest}.json"
+    path = os.path.join(SEARCH_DIR, filename)
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return f"search/{filename}", True
+    return f"search/{filename}", False
+
+def load_cache():
+    if os.path.exists(SEARCH_CACHE_FILE):
+        try:
+            with open(SEARCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {'segments': {}, 'slots': {}}
+
+def save_cache(cache):
+    tmp_path = SEARCH_CACHE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, SEARCH_CACHE_FILE)
+
+def segment_files(entry):
+    return [entry['docs']] + [path for path in entry['buckets'] if path]
+
+def assign_segments(docs, slots):
+    # 資料（infographic_path）ごとに所属セグメントを固定する。位置で区切ると、1件の削除で後ろのセグメントがすべてずれる
+    # 削除で空いた枠は埋めず、新しい資料は最後のセグメントに空きがあればそこへ、なければ新しいセグメントへ入れる
+    live = {data['infographic_path'] for _, data, _ in docs}
+    slots = {path: index for path, index in slots.items() if path in live}
+    counts = {}
+    for index in slots.values():
+        counts[index] = counts.get(index, 0) + 1
+    last = max(slots.values(), default=-1)
+    for _, data, _ in docs:
+        path = data['infographic_path']
+        if path in slots:
+            continue
+        if last < 0 or counts.get(last, 0) >= SEGMENT_SIZE:
+            last += 1
+        slots[path] = last
+        counts[last] = counts.get(last, 0) + 1
+    return slots
+
+def update(items):
+    # items: 一覧に載せる (url, data) を古い順に。変更のあったセグメントだけ原稿を読み直す
+    from generate_infographic import output_paths
+
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    cache = load_cache()
+    # 同じ内容のPDF（別URL）のエントリは同じページを指すので、最初の1件だけを索引に入れる
+    docs = []
+    seen_paths = set()
+    for url, data in items:
+        if data['infographic_path'] in seen_paths:
+            continue
+        seen_paths.add(data['infographic_path'])
+        docs.append((url, data, output_paths(data)[0]))
+
+    previous = cache.get('slots', {}) if cache.get('version') == INDEX_VERSION else {}
+    slots = assign_segments(docs, previous)
+    grouped = {}
+    for doc in docs:
+        grouped.setdefault(slots[doc[1]['infographic_path']], []).append(doc)
+
+    segments = []
+    fresh = {}
+    rebuilt = written = 0
+    for index in sorted(grouped):
+        chunk = grouped[index]
+        digest = hashlib.sha256(''.join(doc_key(*doc) for doc in chunk).encode('utf-8')).hexdigest()
+        cached = cache['segments'].get(str(index))
+        if (not cached or cached['digest'] != digest
+                or not all(os.path.exists(os.path.join(DOCS_DIR, path)) for path in segment_files(cached))):
+            rows, buckets = build_segment(chunk)
+            docs_path, changed = write_json(f"docs-{index:04d}", rows)
+            written += changed
+            bucket_paths = []
+            for number, bucket in enumerate(buckets):
+                if not bucket:
+                    bucket_paths.append(None)
+                    continue
+                path, changed = write_json(f"terms-{index:04d}-{number:02d}", bucket)
+                written += changed
+                bucket_paths.append(path)
+            cached = {'digest': digest, 'docs': docs_path, 'buckets': bucket_paths}
+            rebuilt += 1
+        fresh[str(index)] = cached
+        segments.append({'docs': cached['docs'], 'buckets': cached['buckets']})
+    cache['segments'] = fresh
+    cache['slots'] = slots
+    cache['version'] = INDEX_VERSION
+
+    # どのセグメントからも参照されなくなった古いファイルを消す
+    live = {os.path.basename(path) for entry in fresh.values() for path in segment_files(entry)}
+    for name in os.listdir(SEARCH_DIR):
+        # 圧縮ファイル（.gz/.br）は元のファイルに合わせて残す・消す
+        if name.split('.json')[0] + '.json' not in live:
+            os.remove(os.path.join(SEARCH_DIR, name))
+    save_cache(cache)
+
+    manifest = {'version': INDEX_VERSION, 'ngram': NGRAM, 'segment_size': SEGMENT_SIZE, 'buckets': BUCKETS,
+                'total': len(docs), 'segments': segments}
+    return manifest, rebuilt, written
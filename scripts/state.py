@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+REPO_DIR = os.environ.get('MANUS_REPO_DIR', '/home/ubuntu/manus-infographic')
+PROCESSED_FILE = os.path.join(REPO_DIR, 'data/processed_files.json')
+STATE_DB = os.path.join(REPO_DIR, 'data/state.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    processed INTEGER NOT NULL DEFAULT 0,
+    infographic_path TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_processed ON entries (processed);
+CREATE INDEX IF NOT EXISTS idx_entries_infographic ON entries (infographic_path);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_aliases_sha256 ON aliases (sha256);
+"""
+
+class StateStore:
+    def __init__(self, path=None):
+        self.path = path = path or STATE_DB
+        self.lock = threading.RLock()
+        # トランザクションは明示的に BEGIN/COMMIT で管理する
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.depth = 0
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            outermost = self.depth == 0
+            if outermost:
+                self.conn.execute('BEGIN IMMEDIATE')
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if outermost:
+                    self.conn.execute('ROLLBACK')
+                raise
+            else:
+                self.depth -= 1
+                if outermost:
+                    self.conn.execute('COMMIT')
+
+    def put(self, url, entry):
+        with self.transaction():
+            self.conn.execute(
+                """INSERT INTO entries (url, processed, infographic_path, data) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET
+                       processed = excluded.processed,
+                       infographic_path = excluded.infographic_path,
+                       data = excluded.data""",
+                (url, 1 if entry.get('processed') else 0, entry.get('infographic_path'),
+                 json.dumps(entry, ensure_ascii=False)))
+
+    def put_many(self, items):
+        with self.transaction():
+            for url, entry in items:
+                self.put(url, entry)
+
+    def delete(self, url):
+        with self.transaction():
+            self.conn.execute('DELETE FROM entries WHERE url = ?', (url,))
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM entries WHERE url = ?', (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _query(self, where='', params=()):
+        # 登録順（rowid順）で返す。インデックスページはこの順序に依存している
+        with self.lock:
+            rows = self.conn.execute(f'SELECT url, data FROM entries {where} ORDER BY rowid', params).fetchall()
+        return {url: json.loads(data) for url, data in rows}
+
+    def items(self):
+        return self._query()
+
+    def pending(self):
+        return self._query('WHERE processed = 0')
+
+    def missing_infographic(self):
+        return self._query('WHERE infographic_path IS NULL')
+
+    def with_infographic(self):
+        return self._query('WHERE infographic_path IS NOT NULL')
+
+    def put_blob(self, sha256, path, size):
+        with self.transaction():
+            self.conn.execute('INSERT OR REPLACE INTO blobs (sha256, path, size) VALUES (?, ?, ?)',
+                              (sha256, path, size))
+
+    def get_blob(self, sha256):
+        with self.lock:
+            row = self.conn.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def put_alias(self, url, sha256):
+        with self.transaction():
+            self.conn.execute('INSERT OR REPLACE INTO aliases (url, sha256) VALUES (?, ?)', (url, sha256))
+
+    def get_alias(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT sha256 FROM aliases WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def alias_urls(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute('SELECT url FROM aliases')}
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def migrate_from_json(store, json_path=None):
+    # 既存の processed_files.json を取り込む（順序は JSON の記載順を保つ）
+    # SQLite 側の方が新しいので、登録済みのURLは上書きせず、JSON にしかないエントリだけを追加する
+    with open(json_path or PROCESSED_FILE, 'r', encoding='utf-8') as f:
+        content = f.read()
+    data = json.loads(content) if content else {}
+    known = set(store.items())
+    missing = [(url, entry) for url, entry in data.items() if url not in known]
+    store.put_many(missing)
+    return len(missing)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+            if _store.count() == 0 and os.path.exists(PROCESSED_FILE):
+                migrated = migrate_from_json(_store)
+                print(f"Migrated {migrated} entries from {PROCESSED_FILE} to {STATE_DB}")
+        return _store
+
+def load_processed():
+    return get_store().items()
+
+def save_entry(url, entry):
+    get_store().put(url, entry)
+
+def save_processed(data):
+    get_store().put_many(data.items())
+
+def export_json(path=None):
+    # SQLite の状態を processed_files.json に書き出す（公開時に毎回行い、リポジトリ上の JSON を最新に保つ）
+    path = path or PROCESSED_FILE
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(load_processed(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'migrate':
+        count = migrate_from_json(get_store())
+        print(f"Migrated {count} entries from {PROCESSED_FILE}")
+    elif command == 'export':
+        export_json()
+        print(f"Exported state to {PROCESSED_FILE}")
+    else:
+        print("Usage: state.py migrate|export")
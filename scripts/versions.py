@@ -0,0 +1,91 @@
+import re
+import difflib
+import unicodedata
+from urllib.parse import unquote, urlparse
+
+# 「第5版」「第６版」などの版表記（全角数字は NFKC で半角にしてから照合する）
+EDITION = re.compile(r'第\s*(\d+)\s*版')
+# 旧版と同じ資料とみなす本文の類似度（文字の出現頻度による上限値 quick_ratio で比べる）
+LINK_SIMILARITY = 0.8
+# 変更ページがこの割合を超える場合は差分更新をやめ、通常どおり全体から原稿を作る
+MAX_CHANGED_RATIO = 0.5
+# 差分としてLLMに渡す最大文字数。超える場合は差分更新をやめ、全体から原稿を作る
+DIFF_BUDGET = 12000
+
+def normalize(text):
+    # 版数だけが変わったページを「変更なし」と判定できるよう、版表記と空白の違いを無視する
+    text = unicodedata.normalize('NFKC', text)
+    text = EDITION.sub('第N版', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def edition_of(data, url):
+    # タイトル、なければURL（パーセントエンコードを戻したもの）から版数を取り出す
+    for text in (data.get('text', ''), unquote(url)):
+        match = EDITION.search(unicodedata.normalize('NFKC', text))
+        if match:
+            return int(match.group(1))
+    return None
+
+def series_keys(data, url):
+    # 版表記を除いたタイトルと、同じく版表記を除いたURL（ホスト＋パス）のどちらかが一致すれば同じ資料とみなす
+    keys = set()
+    title = unicodedata.normalize('NFKC', data.get('text', ''))
+    if EDITION.search(title):
+        keys.add(('title', re.sub(r'\s+', '', EDITION.sub('', title))))
+    parsed = urlparse(url)
+    path = unicodedata.normalize('NFKC', unquote(parsed.path))
+    if EDITION.search(path):
+        keys.add(('url', parsed.netloc.lower() + EDITION.sub('', path)))
+    return keys
+
+def find_previous(processed, url, data, has_draft):
+    # 同じ系列で版数が小さく、原稿が残っている最新の版を返す
+    edition = edition_of(data, url)
+    keys = series_keys(data, url)
+    if edition is None or not keys:
+        return None
+    best = None
+    # 並行して他のスレッドが processed に追加しても壊れないよう、スナップショットを走査する
+    for other_url, other in list(processed.items()):
+        if other_url == url or not other.get('processed') or other.get('local_path') == data.get('local_path'):
+            continue
+        other_edition = edition_of(other, other_url)
+        if other_edition is None or other_edition >= edition:
+            continue
+        if not keys & series_keys(other, other_url) or not has_draft(other):
+            continue
+        if best is None or other_edition > best[2]:
+            best = (other_url, other, other_edition)
+    return best[:2] if best else None
+
+def is_same_document(previous_pages, pages):
+    a = normalize("\n".join(previous_pages))
+    b = normalize("\n".join(pages))
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).quick_ratio() >= LINK_SIMILARITY
+
+def page_diff(previous_pages, pages):
+    # ページ単位で対応を取り、追加・変更・削除されたページの組を返す
+    old = [normalize(page) for page in previous_pages]
+    new = [normalize(page) for page in pages]
+    hunks = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag != 'equal':
+            hunks.append((list(range(i1, i2)), list(range(j1, j2))))
+    return hunks
+
+def changed_ratio(hunks, pages):
+    changed = sum(len(new) for _, new in hunks)
+    return changed / max(1, len(pages))
+
+def diff_text(previous_pages, pages, hunks):
+    # 変更箇所を行単位の unified diff にまとめる（前後1行の文脈つき）。途中で切ると変更を取りこぼすので長さは呼び出し側で判定する
+    parts = []
+    for old, new in hunks:
+        old_lines = "\n".join(previous_pages[i] for i in old).splitlines()
+        new_lines = "\n".join(pages[j] for j in new).splitlines()
+        label = f"新版 p.{new[0] + 1}-{new[-1] + 1}" if new else f"旧版 p.{old[0] + 1}-{old[-1] + 1}（削除）"
+        lines = [line for line in difflib.unified_diff(old_lines, new_lines, n=1, lineterm='')
+                 if not line.startswith(('---', '+++')) and line.strip() not in ('+', '-', '')]
+        if lines:
+            parts.append(f"[{label}]\n" + "\n".join(lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,55 @@
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# スクリプトは scripts/ から直接 import される前提なので、そのディレクトリをパスに入れる
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+
+# 各モジュールは import 時に MANUS_REPO_DIR から出力先を決めるので、スクリプトより先に一時ディレクトリを設定する
+# （テストファイルをまとめて実行しても同じ作業ディレクトリを共有する）
+WORKSPACE = tempfile.mkdtemp(prefix='manus-test-')
+os.environ['MANUS_REPO_DIR'] = WORKSPACE
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+atexit.register(shutil.rmtree, WORKSPACE, ignore_errors=True)
+
+from openai import OpenAI
+import benchmark
+import llm_pool
+
+# スタブが返す原稿はリポジトリに保存済みのものを使う
+benchmark.SOURCE_DRAFT_DIR = os.path.join(ROOT_DIR, 'data/drafts')
+
+class StubTestCase(unittest.TestCase):
+    # ベンチマーク用の OpenAI スタブを立て、llm_pool のクライアントをそこへ向ける
+    @classmethod
+    def setUpClass(cls):
+        cls.site_dir = tempfile.mkdtemp(dir=WORKSPACE)
+        cls.server = benchmark.start_server(cls.site_dir, latency=0)
+        base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+        cls.openai = OpenAI(base_url=base_url, max_retries=0)
+        cls.client = mock.patch.object(llm_pool, 'client', cls.openai)
+        cls.client.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.stub = self.server.stub
+        with self.stub['lock']:
+            self.stub['failures'] = []
+            self.stub['batch_failures'] = []
+            self.stub['batch_limit'] = None
+            self.stub['attempts'] = 0
+            self.stub['requests'] = 0
+        # バックオフのジッターを 0 にして待たずに再試行させる
+        patcher = mock.patch.object(llm_pool.random, 'uniform', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
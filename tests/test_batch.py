@@ -0,0 +1,81 @@
+import os
+import json
+import unittest
+from unittest import mock
+
+from support import WORKSPACE, StubTestCase
+import batch
+import pdf_text
+from pdf_text import file_digest
+
+class BatchTest(StubTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(batch, 'client', self.openai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        batch.POLL_INTERVAL = 0.05
+        if os.path.exists(batch.JOBS_FILE):
+            os.remove(batch.JOBS_FILE)
+        self.processed = {url: entry for url, entry in (self.make_entry(i) for i in range(3))}
+
+    def make_entry(self, number):
+        # pdftotext を呼ばずに済むよう、ページのテキストはキャッシュに置いておく
+        url = f"https://example.com/{self.id()}/{number}.pdf"
+        path = os.path.join(WORKSPACE, f"{self._testMethodName}-{number}.pdf")
+        with open(path, 'wb') as f:
+            f.write(f"%PDF-1.4\n% {url}\n".encode('utf-8'))
+        with open(os.path.join(pdf_text.TEXT_CACHE_DIR, f"{file_digest(path)}.json"), 'w', encoding='utf-8') as f:
+            json.dump([f"資料{number}の公募要領。補助対象経費と公募期間。"], f, ensure_ascii=False)
+        return url, {'url': url, 'text': f"資料{number}", 'local_path': path, 'processed': False}
+
+    def submitted_urls(self, job):
+        return sorted(request['url'] for request in job['requests'].values())
+
+    def test_failed_results_are_resubmitted(self):
+        urls = list(self.processed)
+        self.stub['batch_failures'] = [500]
+        jobs = batch.submit(self.processed)
+        self.assertEqual(self.submitted_urls(jobs[0]), sorted(urls))
+        done, open_jobs = batch.poll(self.processed, wait=True)
+        self.assertEqual(open_jobs, [])
+        self.assertEqual(len(done[0]['ingested']), 2)
+        self.assertEqual(list(done[0]['failed'].values()), ['500'])
+
+        failed = [url for url in urls if not self.processed[url]['processed']]
+        self.assertEqual(len(failed), 1)
+        for url in set(urls) - set(failed):
+            self.assertTrue(os.path.exists(batch.generate_infographic.output_paths(self.processed[url])[0]))
+
+        # 次回の投入では失敗した資料だけを投入し直す
+        retry = batch.submit(self.processed)
+        self.assertEqual(self.submitted_urls(retry[0]), failed)
+        batch.poll(self.processed, wait=True)
+        self.assertTrue(all(data['processed'] for data in self.processed.values()))
+
+    def test_partial_output_keeps_ingested_drafts(self):
+        # 期限切れで途中までしか出力がないジョブも、出力された分は取り込む
+        self.stub['batch_limit'] = 1
+        batch.submit(self.processed)
+        done, _ = batch.poll(self.processed, wait=True)
+        self.assertEqual(done[0]['status'], 'expired')
+        self.assertEqual(len(done[0]['ingested']), 1)
+        ingested = [url for url, data in self.processed.items() if data['processed']]
+        self.assertEqual(len(ingested), 1)
+
+        self.stub['batch_limit'] = None
+        retry = batch.submit(self.processed)
+        self.assertEqual(self.submitted_urls(retry[0]), sorted(set(self.processed) - set(ingested)))
+        batch.poll(self.processed, wait=True)
+        self.assertTrue(all(data['processed'] for data in self.processed.values()))
+        # 先に取り込んだ原稿は作り直されない
+        self.assertEqual(self.stub['requests'], 3)
+
+    def test_batch_results_do_not_record_latency(self):
+        batch.submit(self.processed)
+        with mock.patch.object(batch.metrics, 'observe') as observe:
+            batch.poll(self.processed, wait=True)
+        self.assertFalse([call for call in observe.call_args_list if call.args[0] == 'llm_request'])
+
+if __name__ == '__main__':
+    unittest.main()
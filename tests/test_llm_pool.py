@@ -0,0 +1,75 @@
+import time
+import unittest
+from unittest import mock
+
+from support import StubTestCase
+import openai
+import llm_pool
+
+MESSAGES = [{'role': 'user', 'content': 'テスト'}]
+
+class RetryTest(StubTestCase):
+    def test_retries_retryable_statuses(self):
+        self.stub['failures'] = [408, 409, 429, 500, 503]
+        content = llm_pool.chat_completion('gpt-4.1', MESSAGES)
+        self.assertTrue(content)
+        self.assertEqual(self.stub['attempts'], 6)
+        self.assertEqual(self.stub['requests'], 1)
+
+    def test_does_not_retry_client_errors(self):
+        self.stub['failures'] = [400]
+        with self.assertRaises(openai.BadRequestError):
+            llm_pool.chat_completion('gpt-4.1', MESSAGES)
+        self.assertEqual(self.stub['attempts'], 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.stub['failures'] = [500] * 10
+        with self.assertRaises(openai.InternalServerError):
+            llm_pool.call_with_retry(
+                lambda: llm_pool.client.chat.completions.create(model='gpt-4.1', messages=MESSAGES),
+                max_retries=2)
+        self.assertEqual(self.stub['attempts'], 3)
+
+    def test_honours_retry_after(self):
+        self.stub['failures'] = [(429, 0.3)]
+        started = time.monotonic()
+        llm_pool.chat_completion('gpt-4.1', MESSAGES)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(self.stub['attempts'], 2)
+
+class TokenBucketTest(StubTestCase):
+    def test_waits_for_refill(self):
+        # 毎秒10トークン、容量1: 2回目の取得は約0.1秒待たされる
+        bucket = llm_pool.TokenBucket(600, capacity=1)
+        bucket.acquire()
+        started = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_request_limit_spaces_calls(self):
+        limiter = llm_pool.RateLimiter(600, 0)
+        limiter.requests = llm_pool.TokenBucket(600, capacity=1)
+        started = time.monotonic()
+        for _ in range(3):
+            llm_pool.chat_completion('gpt-4.1', MESSAGES, limiter=limiter)
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+        self.assertEqual(self.stub['requests'], 3)
+
+    def test_records_actual_usage(self):
+        # 見積もりより実際のトークン数が多ければ、その差も残高から引かれる
+        limiter = llm_pool.RateLimiter(0, 1000000)
+        llm_pool.chat_completion('gpt-4.1', MESSAGES, limiter=limiter, completion_estimate=1)
+        estimated = len(MESSAGES[0]['content']) + 1
+        self.assertIsNotNone(limiter.tokens)
+        self.assertLess(limiter.tokens.tokens, limiter.tokens.capacity - estimated - 100)
+
+    def test_retries_acquire_again(self):
+        # 失敗した試行もレート制限の枠を消費する
+        self.stub['failures'] = [429]
+        limiter = llm_pool.RateLimiter(600, 0)
+        with mock.patch.object(limiter.requests, 'acquire', wraps=limiter.requests.acquire) as acquire:
+            llm_pool.chat_completion('gpt-4.1', MESSAGES, limiter=limiter)
+        self.assertEqual(acquire.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()